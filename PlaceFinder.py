@@ -1,8 +1,29 @@
-from nltk import pos_tag, download
-from nltk.tokenize import word_tokenize, sent_tokenize
+import hashlib
+import importlib
+import multiprocessing
+import os
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from itertools import islice
+from time import perf_counter
 
-download('punkt_tab')
-download('averaged_perceptron_tagger_eng')
+# NLTK is imported lazily: importing it takes longer than everything else in
+# this module, and its data is only needed once text is tagged.
+
+# NLTK data used by the finder, as (download name, path looked up by nltk.data.find)
+NLTK_RESOURCES = [
+    ("punkt_tab", "tokenizers/punkt_tab/english/"),
+    ("averaged_perceptron_tagger_eng", "taggers/averaged_perceptron_tagger_eng/"),
+]
+
+# Set to 1 to never download NLTK data (e.g. on air-gapped machines)
+OFFLINE_ENV_VAR = "PLACEFINDER_OFFLINE"
 
 # Common words to exclude as standalone place names
 COMMON_WORDS_EXCLUSION_SET = {
@@ -24,42 +45,882 @@ S_CONNECTING = "CONNECTING"   # In a connecting word (of, the, and)
 # Connecting words that can appear within place names
 CONNECTING_WORDS = {"of", "the", "and", "for"}
 
+# Details logged for each post-processing filter type
+FILTER_DETAILS = {
+    "DuplicateWords": "Detected repeated words in '{candidate}'",
+    "Length": "Filtered (length < 2).",
+    "CommonWord": "Filtered (single common word).",
+    "FirstWordCommon": "Filtered (common first word: '{first}').",
+    "LastWordConnector": "Filtered (ends with connector: '{last}').",
+    "POSTaggingCheck": "Filtered (no proper noun tokens in '{candidate}').",
+}
+
+# Filter type of the POS check, which always runs last as the only filter that needs the tags
+FILTER_POS = "POSTaggingCheck"
+
+# POS tags of tokens that can be part of a place name
+PLACE_TAGS = frozenset({"NNP", "NNPS", "NN", "NNS"})
+
+# POS tags that let a known name written in lowercase count as a place
+PROPER_NOUN_TAGS = frozenset({"NNP", "NNPS"})
+
+# Default chunk size when streaming from a file object
+STREAM_CHUNK_SIZE = 1 << 16
+
+# Characters of stream text held without a sentence break before iter_places cuts it
+# anyway, at the last newline or else the last whitespace
+MAX_SENTENCE_LENGTH = 1 << 16
+
+# Characters before the end of the text already split that iter_places splits again with
+# the next chunk, enough for the tokenizer to decide the break after the last token
+SENTENCE_CONTEXT = 256
+
+# Documents sent to a worker process at a time in corpus mode
+CORPUS_BATCH_SIZE = 16
+
+# Sentence results kept by an incremental finder, see PlaceFinder(incremental=True)
+INCREMENTAL_CACHE_SIZE = 4096
+
+# Automaton engines selectable from find_places
+ENGINE_REFERENCE = "reference"  # Per-character automaton above, with full transition logging
+ENGINE_COMPILED = "compiled"    # Table-driven automaton over integer states and character classes
+ENGINE_PRESCAN = "prescan"      # Compiled automaton that jumps from capital to capital (needs NumPy)
+ENGINES = (ENGINE_REFERENCE, ENGINE_COMPILED, ENGINE_PRESCAN)
+
+# Version of the rules that decide which places are found. Bump it with any
+# change that alters results, so persisted results (see cache.py) are redone.
+ENGINE_VERSION = 1
+
+# Integer states of the compiled engine. START is split in two so that the
+# common case (walking through lowercase prose) needs no work at all:
+# Q_START_CONN is START with a lowercase word already in the connecting buffer.
+Q_START, Q_START_CONN, Q_CAPITAL, Q_IN_WORD, Q_SPACE, Q_CONNECTING = range(6)
+STATE_NAMES = [S_START, S_START, S_CAPITAL, S_IN_WORD, S_SPACE, S_CONNECTING]
+
+# Character classes, one for each combination of the str predicates the automaton tests
+C_UPPER = 0          # isupper() and isalpha()
+C_UPPER_OTHER = 1    # isupper() but not isalpha() (e.g. Roman numeral signs)
+C_LOWER = 2          # islower() and isalpha()
+C_LOWER_OTHER = 3    # islower() but not isalpha() (e.g. circled letters)
+C_ALPHA = 4          # isalpha() without case (e.g. CJK)
+C_SPACE = 5          # isspace()
+C_OTHER = 6          # Digits, punctuation, everything else
+N_CLASSES = 7
+
+# Actions attached to transitions of the compiled engine
+A_NONE = 0             # Only the state changes
+A_CONN_MARK = 1        # Lowercase word starts in START
+A_CONN_RESET = 2       # Whitespace in START clears the connecting buffer
+A_WORD_BEGIN = 3       # Capital letter starts a word
+A_WORD_BEGIN_CARRY = 4 # Capital letter starts a word, lowercase run in START is carried along
+A_WORD_END = 5         # Whitespace ends a word, word goes to the word buffer
+A_WORD_FLUSH = 6       # Non-alphabetic char ends a word and finalizes the candidate
+A_CONN_BEGIN = 7       # Lowercase letter after a space starts a potential connecting word
+A_CONN_END = 8         # Whitespace ends a potential connecting word
+A_FINALIZE = 9         # Sequence broken, finalize the candidate
+A_SKIP = 10            # Pre-scan only: no capital here in START, jump to the next one
+
+
+# Trace levels for the processing log
+TRACE_OFF = "off"         # Nothing is logged
+TRACE_EVENTS = "events"   # Processing events only (tagging, filters, final counts)
+TRACE_FULL = "full"       # Events plus every transition of the reference automaton
+
+# State codes recorded in transition traces
+STATE_CODES = {S_START: Q_START, S_CAPITAL: Q_CAPITAL, S_IN_WORD: Q_IN_WORD,
+               S_SPACE: Q_SPACE, S_CONNECTING: Q_CONNECTING}
+
+# Actions of the reference automaton, recorded as codes in the transition trace
+# and only rendered to their message when the log is read
+(R_NONE, R_START_CAPITAL, R_LOWER_START, R_LOWER_CONTINUE, R_IGNORE, R_WORD_CONTINUE,
+ R_FIRST_WORD_END, R_CAPITAL_FINALIZE, R_DISCARD, R_WORD_END, R_WORD_FINALIZE, R_EMPTY_WORD,
+ R_NEW_WORD, R_CONN_START, R_SPACES, R_SPACE_FINALIZE, R_CONN_CONTINUE, R_CONN_VALID,
+ R_CONN_BREAK, R_CONN_FINALIZE, R_EOF) = range(21)
+R_FINALIZED = 0x40  # Flag set on an action code when it finalized a candidate
+
+ACTION_MESSAGES = {
+    R_NONE: "",
+    R_START_CAPITAL: "Started potential place with capital letter: '{char}'",
+    R_LOWER_START: "Lowercase word started: '{char}'",
+    R_LOWER_CONTINUE: "Continuing lowercase word: '{conn}'",
+    R_IGNORE: "Ignoring character: '{char}'",
+    R_WORD_CONTINUE: "Continuing word: '{buffer}'",
+    R_FIRST_WORD_END: "End of first word, now in space after '{word}'",
+    R_CAPITAL_FINALIZE: "Non-alphabet char '{char}' encountered. {result}",
+    R_DISCARD: "Discarding single letter '{capital}' due to non-alphabet char '{char}'",
+    R_WORD_END: "End of word, now in space after '{word}'",
+    R_WORD_FINALIZE: "Non-alphabet char '{char}' encountered. {result}",
+    R_EMPTY_WORD: "Empty buffer with non-alphabet char '{char}'",
+    R_NEW_WORD: "New capitalized word started: '{char}'",
+    R_CONN_START: "Potential connecting word started: '{char}'",
+    R_SPACES: "Multiple spaces - still in space state",
+    R_SPACE_FINALIZE: "Punctuation or non-alphabet char '{char}' ends sequence. {result}",
+    R_CONN_CONTINUE: "Continuing connecting word: '{conn}'",
+    R_CONN_VALID: "Valid connecting word '{conn}' added to place",
+    R_CONN_BREAK: "Non-connecting word '{conn}' breaks sequence. {result}",
+    R_CONN_FINALIZE: "Non-alphabet char '{char}' ends sequence. {result}",
+    R_EOF: "End of text. {result}",
+}
+
+EOF_CHAR = "<<EOF>>"
+
+# Stages timed for get_stats
+STAGE_AUTOMATON = "automaton"             # Finding raw candidates
+STAGE_SENTENCE_SPLIT = "sentence_split"   # Splitting text into sentences and picking the ones to tag
+STAGE_TAGGING = "tagging"                 # Tokenizing and POS-tagging the picked sentences
+STAGE_FILTERING = "filtering"             # Post-processing the raw candidates
+STAGE_GAZETTEER = "gazetteer"             # Matching known place names, when a gazetteer is set
+STAGES = (STAGE_AUTOMATON, STAGE_GAZETTEER, STAGE_SENTENCE_SPLIT, STAGE_TAGGING, STAGE_FILTERING)
+
+
+class TransitionTrace:
+    """Array-backed record of the reference automaton's transitions.
+
+    Each row holds the previous and new state codes, the action code, the
+    character offset and the buffer extents: current buffer length, number of
+    words in the word buffer, index of the candidate being built and start of
+    the connecting buffer. Rows live in one flat array('q'); reading a row
+    renders the dict the automaton used to build eagerly for every character.
+    """
+    ROW_SIZE = 8
+    COLUMNS = ("prev_state", "new_state", "action", "offset", "buffer_length",
+               "word_count", "candidate_index", "connecting_start")
+
+    def __init__(self, text, candidates):
+        self.text = text
+        self.candidates = candidates  # The automaton's raw_candidates list, filled as it runs
+        self.pending_words = []       # Word buffer left unfinalized at end of text
+        self.rows = array('q')
+
+    def column(self, name):
+        """Return one column of the trace as an array"""
+        return self.rows[self.COLUMNS.index(name)::self.ROW_SIZE]
+
+    def __len__(self):
+        return len(self.rows) // self.ROW_SIZE
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._render(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._render(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transition index out of range")
+        return self._render(index)
+
+    def _words(self, candidate_index, count):
+        """Words of the word buffer: a prefix of the candidate it turned into"""
+        if not count:
+            return []
+        if candidate_index < len(self.candidates):
+            return self.candidates[candidate_index].split(" ")[:count]
+        return self.pending_words[:count]
+
+    def _start_connecting_buffer(self, start, offset):
+        """Lowercase characters consumed in START since the connecting buffer began"""
+        text = self.text
+        rows = self.rows
+        row_size = self.ROW_SIZE
+        return "".join(text[i] for i in range(start, offset + 1)
+                       if rows[i * row_size] == Q_START and text[i].islower())
+
+    def _render(self, i):
+        """Build the human-readable log dict of row i"""
+        (prev_state, new_state, code, offset, buffer_length, word_count,
+         candidate_index, connecting_start) = self.rows[i * self.ROW_SIZE:(i + 1) * self.ROW_SIZE]
+        text = self.text
+        action = code & ~R_FINALIZED
+        words = self._words(candidate_index, word_count)
+        char = EOF_CHAR if action == R_EOF else text[offset]
+        buffer = text[offset + 1 - buffer_length:offset + 1] if buffer_length else ""
+
+        message = ACTION_MESSAGES[action]
+        fields = {"char": char, "buffer": buffer}
+        if "{word}" in message:
+            fields["word"] = words[-1]
+        if "{capital}" in message:
+            fields["capital"] = text[offset - 1]
+        if "{conn}" in message:
+            if action == R_LOWER_CONTINUE:
+                fields["conn"] = self._start_connecting_buffer(connecting_start, offset)
+            elif action == R_CONN_CONTINUE:
+                fields["conn"] = text[connecting_start:offset + 1]
+            else:
+                fields["conn"] = text[connecting_start:offset]
+        if "{result}" in message:
+            if code & R_FINALIZED:
+                fields["result"] = f"Finalized candidate: '{self.candidates[candidate_index - 1]}'"
+            else:
+                fields["result"] = "No words in buffer to finalize"
+
+        return {
+            "char": char,
+            "prev_state": STATE_NAMES[prev_state],
+            "action": message.format(**fields),
+            "new_state": STATE_NAMES[new_state],
+            "buffer": buffer,
+            "word_buffer": " ".join(words)
+        }
+
+
+def _classify_char(char):
+    """Map a character to its character class"""
+    if char.isspace():
+        return C_SPACE
+    if char.isupper():
+        return C_UPPER if char.isalpha() else C_UPPER_OTHER
+    if char.islower():
+        return C_LOWER if char.isalpha() else C_LOWER_OTHER
+    if char.isalpha():
+        return C_ALPHA
+    return C_OTHER
+
+
+class _CharClassTable(dict):
+    """str.translate table from code point to character class, filled on first use"""
+    def __missing__(self, code):
+        char_class = _classify_char(chr(code))
+        self[code] = char_class
+        return char_class
+
+
+_CHAR_CLASSES = _CharClassTable((code, _classify_char(chr(code))) for code in range(256))
+
+
+def _build_transition_table():
+    """Build the flat state x character class table of (next state offset, action)"""
+    alpha = (C_UPPER, C_LOWER, C_ALPHA)
+    upper = (C_UPPER, C_UPPER_OTHER)
+    lower = (C_LOWER, C_LOWER_OTHER)
+    table = {}
+    for char_class in range(N_CLASSES):
+        is_alpha = char_class in alpha
+        # START: capitals start a word, lowercase runs fill the connecting buffer
+        if char_class in upper:
+            table[Q_START, char_class] = (Q_CAPITAL, A_WORD_BEGIN)
+            table[Q_START_CONN, char_class] = (Q_CAPITAL, A_WORD_BEGIN_CARRY)
+        elif char_class in lower:
+            table[Q_START, char_class] = (Q_START_CONN, A_CONN_MARK)
+            table[Q_START_CONN, char_class] = (Q_START_CONN, A_NONE)
+        elif char_class == C_SPACE:
+            table[Q_START, char_class] = (Q_START, A_CONN_RESET)
+            table[Q_START_CONN, char_class] = (Q_START, A_CONN_RESET)
+        else:
+            table[Q_START, char_class] = (Q_START, A_NONE)
+            table[Q_START_CONN, char_class] = (Q_START_CONN, A_NONE)
+        # CAPITAL: a lone capital followed by a non-alphabet char is discarded
+        if is_alpha:
+            table[Q_CAPITAL, char_class] = (Q_IN_WORD, A_NONE)
+        elif char_class == C_SPACE:
+            table[Q_CAPITAL, char_class] = (Q_SPACE, A_WORD_END)
+        else:
+            table[Q_CAPITAL, char_class] = (Q_START, A_NONE)
+        # IN_WORD
+        if is_alpha:
+            table[Q_IN_WORD, char_class] = (Q_IN_WORD, A_NONE)
+        elif char_class == C_SPACE:
+            table[Q_IN_WORD, char_class] = (Q_SPACE, A_WORD_END)
+        else:
+            table[Q_IN_WORD, char_class] = (Q_START, A_WORD_FLUSH)
+        # SPACE
+        if char_class in upper:
+            table[Q_SPACE, char_class] = (Q_CAPITAL, A_WORD_BEGIN)
+        elif char_class in lower:
+            table[Q_SPACE, char_class] = (Q_CONNECTING, A_CONN_BEGIN)
+        elif char_class == C_SPACE:
+            table[Q_SPACE, char_class] = (Q_SPACE, A_NONE)
+        else:
+            table[Q_SPACE, char_class] = (Q_START, A_FINALIZE)
+        # CONNECTING: the next state after whitespace depends on the word, see A_CONN_END
+        if is_alpha:
+            table[Q_CONNECTING, char_class] = (Q_CONNECTING, A_NONE)
+        elif char_class == C_SPACE:
+            table[Q_CONNECTING, char_class] = (Q_SPACE, A_CONN_END)
+        else:
+            table[Q_CONNECTING, char_class] = (Q_START, A_FINALIZE)
+
+    # States are stored pre-multiplied by N_CLASSES so a lookup is a single add
+    next_offsets = []
+    actions = []
+    for state in range(len(STATE_NAMES)):
+        for char_class in range(N_CLASSES):
+            next_state, action = table[state, char_class]
+            next_offsets.append(next_state * N_CLASSES)
+            actions.append(action)
+    return next_offsets, actions
+
+
+_NEXT_OFFSETS, _ACTIONS = _build_transition_table()
+
+# In START only a capital letter does more than update the connecting buffer,
+# so with the pre-scan every other character there skips ahead
+_PRESCAN_ACTIONS = [A_SKIP if offset // N_CLASSES in (Q_START, Q_START_CONN)
+                    and offset % N_CLASSES not in (C_UPPER, C_UPPER_OTHER) else action
+                    for offset, action in enumerate(_ACTIONS)]
+
+
+def _capital_offsets(classes):
+    """Offsets of the capital letters in a chunk's character classes, found with NumPy"""
+    import numpy as np
+
+    return np.flatnonzero(np.frombuffer(classes, dtype=np.uint8) <= C_UPPER_OTHER).tolist()
+
+
+_SPACE_CLASS = bytes([C_SPACE])
+_LOWER_CLASSES = re.compile(bytes([ord("["), C_LOWER, C_LOWER_OTHER, ord("]")]))
+
+
+class CompiledAutomaton:
+    """Resumable table-driven automaton that can be fed text in chunks.
+
+    Produces exactly the candidates of PlaceFinder's reference automaton.
+    Within a chunk words are kept as (start, end) slice indices and only
+    joined when a candidate is finalized. Between chunks it keeps just the
+    state, the words of the unfinished sequence and the tail of text still
+    needed, so memory does not depend on the length of the input.
+
+    With prescan, NumPy finds the capital letters of each chunk up front
+    and the automaton jumps from START straight to the next one, working
+    out the connecting buffer it would have built on the way from the
+    skipped text. The candidates are the same; only the lowercase text between
+    them is no longer walked character by character.
+    """
+    def __init__(self, prescan=False):
+        self.prescan = prescan
+        self.reset()
+
+    def reset(self):
+        """Return to the initial state, ready for a new text"""
+        self.offset = Q_START * N_CLASSES  # Current state, pre-multiplied by N_CLASSES
+        self.position = 0        # Absolute offset of the next character
+        self.held_words = []     # (word, start, end) of the unfinished sequence from earlier chunks
+        self.word_start = 0      # Start of the word being read in CAPITAL / IN_WORD
+        self.conn_start = 0      # Start of the lowercase word in START_CONN / CONNECTING
+        self.carry = ""          # Lowercase run carried from START into the connecting buffer
+        self.tail = ""           # Text from the earliest offset the current state still refers to
+        self.tail_start = 0      # Absolute offset of tail
+
+    @property
+    def sequence_start(self):
+        """Earliest offset where a candidate not yet finalized can start"""
+        if self.held_words:
+            return self.held_words[0][1]
+        if self.offset in (Q_CAPITAL * N_CLASSES, Q_IN_WORD * N_CLASSES):
+            return self.word_start
+        return self.position
+
+    def feed(self, chunk, candidates, spans=None):
+        """Run the automaton over the next chunk, appending finalized candidates.
+
+        If spans is a list, the absolute (start, end) offsets of each candidate
+        are appended to it.
+        """
+        if not chunk:
+            return
+        next_offsets = _NEXT_OFFSETS
+        connecting_words = CONNECTING_WORDS
+        text = self.tail + chunk if self.tail else chunk
+        text_start = self.tail_start if self.tail else self.position
+        held = self.held_words
+        words = []          # (start, end) in text of each word added during this chunk
+        word_start = self.word_start - text_start
+        conn_start = self.conn_start - text_start
+        carry = self.carry
+        offset = self.offset
+        classes = chunk.translate(_CHAR_CLASSES).encode("ascii")
+        chunk_start = len(text) - len(chunk)
+        if self.prescan:
+            actions = _PRESCAN_ACTIONS
+            capitals = _capital_offsets(classes)
+        else:
+            actions = _ACTIONS
+
+        # The pre-scan leaves the loop to jump ahead and comes back in at resume
+        resume = 0
+        while resume < len(classes):
+            segment = memoryview(classes)[resume:] if resume else classes
+            for i, char_class in enumerate(segment, chunk_start + resume):
+                k = offset + char_class
+                offset = next_offsets[k]
+                action = actions[k]
+                if not action:
+                    continue
+                if action == A_CONN_RESET:
+                    carry = ""
+                elif action == A_CONN_MARK:
+                    conn_start = i
+                elif action == A_WORD_END:
+                    words.append((word_start, i))
+                elif action == A_WORD_BEGIN:
+                    word_start = i
+                elif action == A_WORD_BEGIN_CARRY:
+                    carry += "".join([char for char in text[conn_start:i] if char.islower()])
+                    word_start = i
+                elif action == A_CONN_BEGIN:
+                    conn_start = i
+                    carry = ""
+                elif action == A_SKIP:
+                    # Replay START over the text up to the next capital: whitespace
+                    # clears the carry, the first lowercase letter after the last
+                    # whitespace starts the connecting buffer
+                    offset = k - char_class   # State before this character
+                    position = i - chunk_start
+                    j = bisect_left(capitals, position)
+                    resume = capitals[j] if j < len(capitals) else len(classes)
+                    space = classes.rfind(_SPACE_CLASS, position, resume)
+                    if space >= 0:
+                        carry = ""
+                        offset = Q_START * N_CLASSES
+                        position = space + 1
+                    if offset == Q_START * N_CLASSES and position < resume:
+                        if classes[position] in (C_LOWER, C_LOWER_OTHER):
+                            offset = Q_START_CONN * N_CLASSES
+                            conn_start = position + chunk_start
+                        else:
+                            lower = _LOWER_CLASSES.search(classes, position, resume)
+                            if lower:
+                                offset = Q_START_CONN * N_CLASSES
+                                conn_start = lower.start() + chunk_start
+                    break
+                else:
+                    if action == A_WORD_FLUSH:
+                        words.append((word_start, i))
+                    elif action == A_CONN_END:
+                        if text[conn_start:i].lower() in connecting_words:
+                            words.append((conn_start, i))
+                            continue
+                        offset = Q_START * N_CLASSES
+                    if words or held:
+                        names = [text[start:end] for start, end in words]
+                        if held:
+                            names[:0] = [word for word, _, _ in held]
+                            start = held[0][1]
+                            end = words[-1][1] + text_start if words else held[-1][2]
+                            held = []
+                        else:
+                            start = words[0][0] + text_start
+                            end = words[-1][1] + text_start
+                        candidates.append(" ".join(names))
+                        if spans is not None:
+                            spans.append((start, end))
+                        words = []
+                    carry = ""
+            else:
+                break
+
+        # Keep the unfinished sequence and the text the state still points into
+        self.held_words = held + [(text[start:end], start + text_start, end + text_start)
+                                  for start, end in words]
+        self.word_start = word_start + text_start
+        self.conn_start = conn_start + text_start
+        self.carry = carry
+        self.offset = offset
+        self.position = text_start + len(text)
+        state = offset // N_CLASSES
+        if state in (Q_CAPITAL, Q_IN_WORD):
+            keep_from = word_start
+        elif state in (Q_START_CONN, Q_CONNECTING):
+            keep_from = conn_start
+        else:
+            keep_from = len(text)
+        self.tail = text[keep_from:]
+        self.tail_start = text_start + keep_from
+
+    def finish(self, candidates, spans=None):
+        """Flush the word and connecting buffers at end of text like the reference automaton"""
+        state = self.offset // N_CLASSES
+        if state in (Q_CAPITAL, Q_IN_WORD, Q_SPACE, Q_CONNECTING):
+            words = list(self.held_words)
+            end = self.position
+            last_word = self.tail if state in (Q_CAPITAL, Q_IN_WORD) else ""
+            if last_word:
+                words.append((last_word, self.word_start, end))
+            if state == Q_CONNECTING:
+                connecting = self.tail
+                if connecting.lower() in CONNECTING_WORDS:
+                    words.append((connecting, self.conn_start, end))
+                connecting = ""
+            else:
+                connecting = self.carry
+            names = [word for word, _, _ in words]
+            # A lowercase run carried from START has no span of its own
+            if connecting and connecting.lower() in CONNECTING_WORDS:
+                names.append(connecting)
+            # The reference automaton leaves the word in current_buffer, so
+            # _finalize_candidate appends it a second time
+            if last_word:
+                names.append(last_word)
+            if names:
+                candidates.append(" ".join(names))
+                if spans is not None:
+                    spans.append((words[0][1], words[-1][2]))
+        self.reset()
+
+
+def run_compiled_dfa(text, spans=None, prescan=False):
+    """Run the table-driven automaton over text and return the raw candidates.
+
+    If spans is a list, the (start, end) offsets of each candidate in text
+    are appended to it. prescan selects CompiledAutomaton's pre-scan mode.
+    """
+    automaton = CompiledAutomaton(prescan)
+    candidates = []
+    automaton.feed(text, candidates, spans)
+    automaton.finish(candidates, spans)
+    return candidates
+
+
+_resources_ready = False
+_resources_lock = threading.Lock()
+
+
+def ensure_nltk_resources(offline=None):
+    """Make sure the NLTK data in NLTK_RESOURCES is installed, downloading it if allowed.
+
+    Runs once per process and is called on first use of the tokenizer or
+    tagger; call it explicitly to pay the cost at startup instead. offline
+    defaults to the PLACEFINDER_OFFLINE environment variable. In offline mode
+    a missing resource raises LookupError at once instead of going to the
+    network.
+    """
+    global _resources_ready
+    if _resources_ready:
+        return
+    with _resources_lock:
+        if _resources_ready:
+            return
+        import nltk
+
+        if offline is None:
+            offline = os.environ.get(OFFLINE_ENV_VAR, "").lower() in ("1", "true", "yes")
+        for name, path in NLTK_RESOURCES:
+            try:
+                nltk.data.find(path)
+            except LookupError:
+                if offline:
+                    raise LookupError(f"NLTK resource '{name}' is not installed and downloads are disabled; "
+                                      f"install it with: python -m nltk.downloader {name}") from None
+                if not nltk.download(name, quiet=True):
+                    raise LookupError(f"Could not download NLTK resource '{name}'") from None
+        _resources_ready = True
+
+
+@lru_cache(maxsize=None)
+def _sentence_tokenizer():
+    """Punkt sentence tokenizer, loaded once per process"""
+    ensure_nltk_resources()
+    from nltk.tokenize.punkt import PunktTokenizer
+
+    return PunktTokenizer()
+
+
+@lru_cache(maxsize=None)
+def _get_tagger():
+    """Perceptron POS tagger, loaded once per process"""
+    ensure_nltk_resources()
+    from nltk.tag.perceptron import PerceptronTagger
+
+    return PerceptronTagger()
+
+
+@lru_cache(maxsize=None)
+def _nltk_version():
+    """Installed NLTK version, read without importing NLTK"""
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("nltk")
+    except PackageNotFoundError:
+        return None
+
+
+def _tag_sentences(sentences):
+    """Tokenize and POS-tag sentences with one batched tagger call"""
+    if not sentences:
+        return []
+    tagger = _get_tagger()
+    from nltk.tokenize import word_tokenize
+
+    return tagger.tag_sents([word_tokenize(sentence) for sentence in sentences])
+
+
+def _overlapping(sentence_spans, spans):
+    """Indices of the sentence spans that overlap any of the sorted (start, end) spans"""
+    selected = []
+    j = 0
+    for i, (start, end) in enumerate(sentence_spans):
+        while j < len(spans) and spans[j][1] <= start:
+            j += 1
+        if j < len(spans) and spans[j][0] < end:
+            selected.append(i)
+    return selected
+
+
+def _select_sentences(text, spans=None):
+    """Split text into sentences and pick the ones overlapping spans (all of them if spans is None)"""
+    sentence_spans = list(_sentence_tokenizer().span_tokenize(text))
+    sentences = [text[start:end] for start, end in sentence_spans]
+    if spans is None:
+        return sentences, list(range(len(sentences)))
+    return sentences, _overlapping(sentence_spans, spans)
+
+
+def _common_prefix_length(a, b):
+    """Length of the longest common prefix of two strings, by binary search over slice comparisons"""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix_length(a, b, limit):
+    """Length of the longest common suffix of two strings, at most limit"""
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _iter_chunks(source, chunk_size):
+    """Yield str chunks from a str, a text file object or an iterable of str"""
+    if isinstance(source, str):
+        if source:
+            yield source
+    elif hasattr(source, "read"):
+        yield from iter(partial(source.read, chunk_size), "")
+    else:
+        for chunk in source:
+            if chunk:
+                yield chunk
+
+
+@lru_cache(maxsize=1 << 16)
+def _candidate_words(candidate):
+    """Words of a candidate as a tuple of interned strings, split once per distinct candidate"""
+    return tuple(map(sys.intern, candidate.split(" ")))
+
+
+# Post-processing filters. Each check takes the candidate's words and returns True to reject it.
+
+def _has_duplicate_words(words):
+    # e.g. "Singapore Singapore"
+    return len(words) > 1 and len(set(words)) < len(words)
+
+
+def _is_too_short(words):
+    return len(words) == 1 and len(words[0]) < 2
+
+
+def _is_common_word(words):
+    return len(words) == 1 and words[0] in COMMON_WORDS_EXCLUSION_SET
+
+
+def _starts_with_common_word(words):
+    # "The" is allowed to start a place name of several words
+    return len(words) > 1 and words[0] in COMMON_WORDS_EXCLUSION_SET and words[0].lower() != "the"
+
+
+def _ends_with_connector(words):
+    return len(words) > 1 and words[-1].lower() in CONNECTING_WORDS
+
+
+# (filter type, check) of the filters every finder starts with, in the order
+# they run; the POS check follows them. See PlaceFinder.register_filter.
+FILTERS = [
+    ("DuplicateWords", _has_duplicate_words),
+    ("Length", _is_too_short),
+    ("CommonWord", _is_common_word),
+    ("FirstWordCommon", _starts_with_common_word),
+    ("LastWordConnector", _ends_with_connector),
+]
+
+
 class PlaceFinder:
-    def __init__(self):
+    def __init__(self, engine=ENGINE_REFERENCE, trace_level=TRACE_FULL, metrics_hook=None, gazetteer=None,
+                 incremental=False, cache_size=INCREMENTAL_CACHE_SIZE, log_rejections=True, filters=None):
+        """metrics_hook, if given, is called with get_stats() after every
+        find_places, find_places_batch and completed iter_places call
+        (e.g. a PrometheusExporter).
+
+        gazetteer is an optional gazetteer.Gazetteer of known place names.
+        Candidates found in it are kept without the other filters or POS
+        checks, and find_places also reports known names the automaton
+        misses (lowercase, or after a connecting word). Common and
+        connecting words are not known names whatever their case, and a
+        single lowercase word needs a proper noun tag.
+
+        With incremental, find_places keeps the results of up to cache_size
+        sentences and only processes the sentences that changed since
+        earlier calls, see _find_places_incremental.
+
+        With log_rejections=False no PostProcessFilter event is logged for
+        rejected candidates, even when other events are.
+
+        filters is an optional list of (filter_type, check, version[, detail[,
+        before]]) tuples, each passed to register_filter. find_places_many,
+        the server and export_places hand it to their finders in the same
+        form; worker processes get it pickled, so checks must then be
+        module-level functions, see load_filters."""
+        if trace_level not in (TRACE_OFF, TRACE_EVENTS, TRACE_FULL):
+            raise ValueError(f"Unknown trace level: {trace_level!r}")
+        self.engine = engine
+        self.trace_level = trace_level
         self.current_state = S_START
         self.current_buffer = ""      # Buffer for accumulating characters
         self.word_buffer = []         # Buffer for accumulating words
         self.connecting_buffer = ""   # Buffer for potential connecting word
+        self.position = 0             # Offset of the next character in the text
+        self.connecting_start = 0     # Offset where the connecting buffer started
+        self.buffer_start = 0         # Offset where the current buffer started
+        self.sequence_start = 0       # Offset of the first word in the word buffer
+        self.sequence_end = 0         # Offset just past the last word in the word buffer
         self.raw_candidates = []
-        self.logs = []
-        self.pos_tags_lines = []      # Now will store actual POS tags
+        self.raw_spans = []           # (start, end) offsets of each raw candidate in the text
+        self.logs = []                # Event dicts and TransitionTrace records, see get_logs
+        self.pos_tags_lines = []      # POS tags per sentence, None for sentences not tagged yet
+        self._sentences = []          # Sentences of the last text, see get_pos_tags_lines
         self.token_tag_map = {}       # Map tokens to their POS tags
+        self._trace = None            # TransitionTrace of the running automaton (full tracing)
+        self.metrics_hook = metrics_hook
+        self.gazetteer = gazetteer
+        self.incremental = incremental
+        self.cache_size = cache_size
+        self._units = OrderedDict()   # Incremental mode: LRU of sentence results by content hash
+        self._previous = None         # Incremental mode: (text, sentence spans, token_tag_map, decisions) of the last call
+        self.log_rejections = log_rejections
+        self.filters = list(FILTERS)  # (filter type, check) run before the POS check, see register_filter
+        self.filter_details = dict(FILTER_DETAILS)
+        self.filter_versions = {}     # Versions of the registered filters; ENGINE_VERSION covers the built-in ones
+        self._compile_filters()
+        for spec in filters or ():
+            self.register_filter(*spec)
+        self._reset_stats()
 
-    def _perform_pos_tagging(self, text):
-        """Process text with NLTK to generate POS tags"""
-        self.pos_tags_lines = []
-        self.token_tag_map = {}
-        
-        # Split text into sentences
-        sentences = sent_tokenize(text)
-        
-        for sentence in sentences:
-            # Tokenize and tag
-            tokens = word_tokenize(sentence)
-            tagged = pos_tag(tokens)
-            self.pos_tags_lines.append(tagged)
-            
-            # Build token to tag map for quick lookup
-            for token, tag in tagged:
-                # If token appears multiple times with different tags, prioritize proper noun tags
-                if token in self.token_tag_map and tag.startswith('NNP'):
-                    self.token_tag_map[token] = tag
-                elif token not in self.token_tag_map:
-                    self.token_tag_map[token] = tag
-            
-        self.logs.append({"event": "POS_Tagging", "detail": f"Generated POS tags for {len(sentences)} sentences"})
+    def register_filter(self, filter_type, check, version, detail=None, before=None):
+        """Add a post-processing filter to this finder.
+
+        check is called with the words of a candidate as a tuple of str and
+        returns True to reject it. It runs after the built-in filters (or
+        just before the filter type named by before) and always before the
+        POS check. Like the built-in ones it runs once per distinct candidate
+        of a call, so it should only depend on the words. detail is the
+        logged message, a format string that may use {candidate}, {first}
+        and {last}.
+
+        version identifies what check does (e.g. 1, or "2024-05"): it goes
+        into config_fingerprint, so change it whenever the check changes or
+        cached results will be reused.
+        """
+        if filter_type in self.filter_details:
+            raise ValueError(f"Filter type {filter_type!r} is already registered")
+        if version is None:
+            raise ValueError(f"Filter {filter_type!r} needs a version")
+        index = len(self.filters)
+        if before is not None:
+            index = [name for name, _ in self.filters].index(before)
+        self.filters.insert(index, (filter_type, check))
+        self.filter_details[filter_type] = detail or f"Filtered ({filter_type})."
+        self.filter_versions[filter_type] = version
+        self._compile_filters()
+
+    def _compile_filters(self):
+        """Freeze the filters into the tuple _check_candidate runs through"""
+        self._filter_stages = tuple(self.filters) + ((FILTER_POS, self._fails_pos_check),)
+
+    def _reset_stats(self):
+        """Clear the counters and stage timings of the last call"""
+        self._stats = {"chars": 0, "sentences": 0, "sentences_tagged": 0,
+                       "raw_candidates": 0, "kept_candidates": 0, "gazetteer_matches": 0}
+        self._rejections = Counter()
+        self._timings = dict.fromkeys(STAGES, 0.0)
+
+    @contextmanager
+    def _timed(self, stage):
+        """Add the time spent in the with block to a stage"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self._timings[stage] += perf_counter() - start
+
+    def _emit_stats(self):
+        if self.metrics_hook is not None:
+            self.metrics_hook(self.get_stats())
+
+    def get_stats(self):
+        """Counters and per-stage timings (seconds) of the last find_places, find_places_batch or iter_places call"""
+        stats = dict(self._stats)
+        stats["rejections"] = dict(self._rejections)
+        stats["timings"] = dict(self._timings)
+        return stats
+
+    def config_fingerprint(self):
+        """Hash of the configuration that decides the places found, keying persisted results.
+
+        Covers ENGINE_VERSION, CONNECTING_WORDS, COMMON_WORDS_EXCLUSION_SET,
+        the filters (by type and, for registered ones, version), the NLTK
+        version and the gazetteer file. The engine is left out since every
+        engine finds the same places.
+        """
+        parts = [ENGINE_VERSION, sorted(CONNECTING_WORDS), sorted(COMMON_WORDS_EXCLUSION_SET),
+                 [(filter_type, self.filter_versions.get(filter_type)) for filter_type, _ in self.filters],
+                 _nltk_version()]
+        if self.gazetteer is not None:
+            info = os.stat(self.gazetteer.path)
+            parts.append((os.path.abspath(self.gazetteer.path), info.st_size, info.st_mtime_ns, len(self.gazetteer)))
+        return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+    def _perform_pos_tagging(self, text, spans=None):
+        """Process text with NLTK to generate POS tags.
+
+        With spans, only the sentences overlapping one of the (start, end)
+        spans are tagged; the others stay None in pos_tags_lines until
+        get_pos_tags_lines is called.
+        """
+        with self._timed(STAGE_SENTENCE_SPLIT):
+            sentences, selected = _select_sentences(text, spans)
+        with self._timed(STAGE_TAGGING):
+            tagged = _tag_sentences([sentences[i] for i in selected])
+        self._store_pos_tags(sentences, selected, tagged)
         return self.pos_tags_lines
 
+    def _store_pos_tags(self, sentences, selected, tagged):
+        """Keep the tags of the selected sentences and build token_tag_map from them"""
+        self._sentences = sentences
+        self._stats["sentences"] += len(sentences)
+        self._stats["sentences_tagged"] += len(selected)
+        self.pos_tags_lines = [None] * len(sentences)
+        self.token_tag_map = {}
+        for i, sentence_tags in zip(selected, tagged):
+            self.pos_tags_lines[i] = sentence_tags
+            self._add_tags(sentence_tags)
+
+        if self.trace_level != TRACE_OFF:
+            self.logs.append({"event": "POS_Tagging",
+                              "detail": f"Generated POS tags for {len(selected)} of {len(sentences)} sentences"})
+
+    def _add_tags(self, tagged):
+        """Add the (token, tag) pairs of a sentence to token_tag_map"""
+        # Build token to tag map for quick lookup
+        for token, tag in tagged:
+            # If token appears multiple times with different tags, prioritize proper noun tags
+            if token in self.token_tag_map and tag.startswith('NNP'):
+                self.token_tag_map[token] = tag
+            elif token not in self.token_tag_map:
+                self.token_tag_map[token] = tag
+
     def _is_potential_place_token(self, token, tag=None):
         """Checks if a token could be part of a place name."""
         if not token:
@@ -73,46 +934,44 @@ class PlaceFinder:
                 return token[0].isupper() and len(token) > 1
         
         # Must be capitalized and a relevant noun type (Proper Noun, or general Noun)
-        return token[0].isupper() and tag in ['NNP', 'NNPS', 'NN', 'NNS']
+        return token[0].isupper() and tag in PLACE_TAGS
 
-    def _log_char_action(self, char, prev_state, action, new_state):
-        """Log character transitions for debugging"""
-        log_entry = {
-            "char": char,
-            "prev_state": prev_state,
-            "action": action,
-            "new_state": new_state,
-            "buffer": self.current_buffer,
-            "word_buffer": " ".join(self.word_buffer)
-        }
-        self.logs.append(log_entry)
+    def _push_word(self, word, start=None):
+        """Append a word to the word buffer, extending the sequence span when its offset is known"""
+        if start is not None:
+            if not self.word_buffer:
+                self.sequence_start = start
+            self.sequence_end = start + len(word)
+        self.word_buffer.append(word)
 
     def _finalize_candidate(self):
-        """Add current word to word buffer and reset state"""
+        """Add current word to word buffer and reset state, returns whether a candidate was made"""
         # Add last word if not empty (and not already added to word_buffer)
         if self.current_buffer:
-            self.word_buffer.append(self.current_buffer)
+            self._push_word(self.current_buffer, self.buffer_start)
             self.current_buffer = ""
             
         # Create candidate from word buffer if not empty
         if self.word_buffer:
             candidate = " ".join(self.word_buffer)
             self.raw_candidates.append(candidate)
-            result = f"Finalized candidate: '{candidate}'"
+            self.raw_spans.append((self.sequence_start, self.sequence_end))
+            finalized = True
         else:
-            result = "No words in buffer to finalize"
-            
+            finalized = False
+
         # Reset buffers
         self.current_buffer = ""
         self.word_buffer = []
         self.connecting_buffer = ""
         
-        return result
+        return finalized
 
     def process_char(self, char):
         """Process a single character through the automaton"""
         prev_state = self.current_state
-        action = ""
+        action = R_NONE
+        finalized = False
         
         # Consider newlines as spaces for state transition purposes
         is_space_like = char.isspace() or char == '\n' or char == '\r'
@@ -121,114 +980,366 @@ class PlaceFinder:
         if self.current_state == S_START:
             if char.isupper():
                 self.current_buffer = char
+                self.buffer_start = self.position
                 self.current_state = S_CAPITAL
-                action = f"Started potential place with capital letter: '{char}'"
+                action = R_START_CAPITAL
             elif char.islower() and not self.connecting_buffer:
                 self.connecting_buffer = char
-                action = f"Lowercase word started: '{char}'"
+                self.connecting_start = self.position
+                action = R_LOWER_START
             elif char.islower() and self.connecting_buffer:
                 self.connecting_buffer += char
-                action = f"Continuing lowercase word: '{self.connecting_buffer}'"
+                action = R_LOWER_CONTINUE
             elif is_space_like and self.connecting_buffer:
                 self.connecting_buffer = ""
             else:
-                action = f"Ignoring character: '{char}'"                
+                action = R_IGNORE
         elif self.current_state == S_CAPITAL:
             if char.isalpha():
                 self.current_buffer += char
                 self.current_state = S_IN_WORD
-                action = f"Continuing word: '{self.current_buffer}'"
+                action = R_WORD_CONTINUE
             elif char.isspace():
-                self.word_buffer.append(self.current_buffer)
+                self._push_word(self.current_buffer, self.buffer_start)
                 self.current_buffer = ""
                 self.current_state = S_SPACE
-                action = f"End of first word, now in space after '{self.word_buffer[-1]}'"
+                action = R_FIRST_WORD_END
             else:
                 # Non-alphabetic char breaks the sequence
                 if len(self.current_buffer) > 1:  # Only keep if word is more than 1 char
-                    self.word_buffer.append(self.current_buffer)
-                    result = self._finalize_candidate()
-                    action = f"Non-alphabet char '{char}' encountered. {result}"
+                    self._push_word(self.current_buffer, self.buffer_start)
+                    finalized = self._finalize_candidate()
+                    action = R_CAPITAL_FINALIZE
                 else:
-                    action = f"Discarding single letter '{self.current_buffer}' due to non-alphabet char '{char}'"
+                    action = R_DISCARD
                 self.current_buffer = ""
                 self.current_state = S_START
                 
         elif self.current_state == S_IN_WORD:
             if char.isalpha():
                 self.current_buffer += char
-                action = f"Continuing word: '{self.current_buffer}'"
+                action = R_WORD_CONTINUE
             elif is_space_like:
-                self.word_buffer.append(self.current_buffer)
+                self._push_word(self.current_buffer, self.buffer_start)
                 self.current_buffer = ""
                 self.current_state = S_SPACE
-                action = f"End of word, now in space after '{self.word_buffer[-1]}'"
+                action = R_WORD_END
             else:
                 # Non-alphabetic char breaks the sequence
                 if self.current_buffer:  # Only process if buffer has content
-                    self.word_buffer.append(self.current_buffer)
+                    self._push_word(self.current_buffer, self.buffer_start)
                     self.current_buffer = "" # Clear this to avoid duplication in _finalize_candidate
-                    result = self._finalize_candidate()
-                    action = f"Non-alphabet char '{char}' encountered. {result}"
+                    finalized = self._finalize_candidate()
+                    action = R_WORD_FINALIZE
                 else:
-                    action = f"Empty buffer with non-alphabet char '{char}'"
+                    action = R_EMPTY_WORD
                 self.current_buffer = ""
                 self.current_state = S_START     
                            
         elif self.current_state == S_SPACE:
             if char.isupper():
                 self.current_buffer = char
+                self.buffer_start = self.position
                 self.current_state = S_CAPITAL
-                action = f"New capitalized word started: '{char}'"
+                action = R_NEW_WORD
             elif char.islower():
                 self.connecting_buffer = char
+                self.connecting_start = self.position
                 self.current_state = S_CONNECTING
-                action = f"Potential connecting word started: '{char}'"
+                action = R_CONN_START
             elif char.isspace():
-                action = "Multiple spaces - still in space state"
+                action = R_SPACES
             else:
                 # Punctuation or other non-alphabetic char ends the sequence
-                result = self._finalize_candidate()
+                finalized = self._finalize_candidate()
                 self.current_state = S_START
-                action = f"Punctuation or non-alphabet char '{char}' ends sequence. {result}"
+                action = R_SPACE_FINALIZE
                 
         elif self.current_state == S_CONNECTING:
             if char.isalpha():
                 self.connecting_buffer += char
-                action = f"Continuing connecting word: '{self.connecting_buffer}'"
+                action = R_CONN_CONTINUE
             elif char.isspace():
                 # Check if it's a valid connecting word
                 if self.connecting_buffer.lower() in CONNECTING_WORDS:
-                    self.word_buffer.append(self.connecting_buffer)
-                    action = f"Valid connecting word '{self.connecting_buffer}' added to place"
+                    self._push_word(self.connecting_buffer, self.connecting_start)
+                    action = R_CONN_VALID
                     self.current_state = S_SPACE
                 else:
                     # Not a connecting word, so finalize candidate and reset
-                    result = self._finalize_candidate()
+                    finalized = self._finalize_candidate()
                     self.current_state = S_START
-                    action = f"Non-connecting word '{self.connecting_buffer}' breaks sequence. {result}"
+                    action = R_CONN_BREAK
                 self.connecting_buffer = ""
             else:
                 # Non-alphabetic char breaks the sequence
-                result = self._finalize_candidate()
+                finalized = self._finalize_candidate()
                 self.current_state = S_START
                 self.connecting_buffer = ""
-                action = f"Non-alphabet char '{char}' ends sequence. {result}"
-        
-        self._log_char_action(char, prev_state, action, self.current_state)
+                action = R_CONN_FINALIZE
+
+        if self._trace is not None:
+            self._record_transition(prev_state, action, finalized)
+        self.position += 1
+
+    def _record_transition(self, prev_state, action, finalized, new_state=None):
+        """Record a transition in the full trace"""
+        if finalized:
+            action |= R_FINALIZED
+        self._trace.rows.extend((STATE_CODES[prev_state], STATE_CODES[new_state or self.current_state], action,
+                                 self.position, len(self.current_buffer), len(self.word_buffer),
+                                 len(self.raw_candidates), self.connecting_start))
     
-    def find_places(self, text):
-        """Process the entire text character by character"""
-        # Run POS tagging first so we can validate with it later
-        self._perform_pos_tagging(text)
-        
+    def find_places(self, text, engine=None):
+        """Process the entire text character by character.
+
+        engine selects the automaton: ENGINE_REFERENCE (default, logs every
+        transition), ENGINE_COMPILED (table-driven, no per-character logs) or
+        ENGINE_PRESCAN (compiled, skipping text without capitals using NumPy).
+        All produce the same raw candidates. With trace_level TRACE_FULL only
+        the reference engine records character transitions.
+        """
+        engine = self._check_engine(engine)
+        if self.incremental:
+            return self._find_places_incremental(text, engine)
+        self.logs = []
+        self._reset_stats()
+        self._run_automaton(text, engine)
+        matches = self._find_gazetteer_matches(text)
+
+        # Only words of candidates that reach the POS check are looked up, so only their sentences are tagged
+        self._perform_pos_tagging(text, self._tag_spans(text, matches))
+        if matches:
+            with self._timed(STAGE_GAZETTEER):
+                self._add_gazetteer_matches(text, matches)
+        counts = self.post_process_candidates()
+        self._emit_stats()
+        return counts
+
+    def find_places_batch(self, texts, engine=None):
+        """Run find_places over several texts with a single batched tagger call.
+
+        Returns the list of count dicts, one per text. Logs and POS tags
+        are only kept for the last text.
+        """
+        results = list(self._iter_batch(texts, engine))
+        self._emit_stats()
+        return results
+
+    def find_place_spans_batch(self, texts, engine=None):
+        """Like find_place_spans over several texts, with a single batched tagger call"""
+        results = [self._kept_spans(counts) for counts in self._iter_batch(texts, engine)]
+        self._emit_stats()
+        return results
+
+    def _iter_batch(self, texts, engine):
+        """Yield the counts of each text, with raw_candidates, raw_spans and logs set to that text's"""
+        engine = self._check_engine(engine)
+        self._reset_stats()
+        prepared = []
+        to_tag = []
+        for text in texts:
+            self.logs = []
+            self._run_automaton(text, engine)
+            matches = self._find_gazetteer_matches(text)
+            with self._timed(STAGE_SENTENCE_SPLIT):
+                sentences, selected = _select_sentences(text, self._tag_spans(text, matches))
+            prepared.append((text, self.raw_candidates, self.raw_spans, self.logs, matches, sentences, selected))
+            to_tag.extend(sentences[i] for i in selected)
+
+        with self._timed(STAGE_TAGGING):
+            tagged = _tag_sentences(to_tag)
+        position = 0
+        for text, raw_candidates, raw_spans, logs, matches, sentences, selected in prepared:
+            self.raw_candidates, self.raw_spans, self.logs = raw_candidates, raw_spans, logs
+            self._store_pos_tags(sentences, selected, tagged[position:position + len(selected)])
+            position += len(selected)
+            if matches:
+                with self._timed(STAGE_GAZETTEER):
+                    self._add_gazetteer_matches(text, matches)
+            yield self.post_process_candidates()
+
+    def _find_places_incremental(self, text, engine):
+        """find_places reusing the results of sentences seen in earlier calls.
+
+        The text is cut into units of one sentence and the whitespace after
+        it. A unit's candidates, spans and tags are kept in an LRU keyed by
+        a hash of its text, so after an edit only the units that changed
+        are run through the automaton and tagged; the others are shifted to
+        their new offsets. A unit is only cached on its own when the
+        automaton leaves it in START with nothing buffered, otherwise it is
+        merged with the next one, so the raw candidates are exactly those of
+        a full run. Only the part of the text around the edit is split into
+        sentences again, and filters only run again for candidates whose
+        words were tagged differently.
+
+        No transition trace is recorded, and a gazetteer only validates
+        candidates, as in iter_places.
+        """
+        self.logs = []
+        self._reset_stats()
+        with self._timed(STAGE_SENTENCE_SPLIT):
+            sentence_spans = self._split_incremental(text)
+        bounds = [0] + [start for start, _ in sentence_spans[1:]] + [len(text)]
+
+        # Walk the units, merging a unit with the next while the automaton does not end clean
+        groups = []     # (start, entry) in text order
+        missed = []     # Entries whose sentences still have to be tagged
+        first = 0
+        while first < len(bounds) - 1:
+            last = first + 1
+            while True:
+                start, end = bounds[first], bounds[last]
+                final = last == len(bounds) - 1
+                key = (hashlib.blake2b(text[start:end].encode("utf-8", "surrogatepass"), digest_size=16).digest(),
+                       final)
+                entry = self._units.get(key)
+                if entry is None:
+                    entry = self._run_unit(text, start, end, final, engine, sentence_spans[first:last])
+                    self._units[key] = entry
+                    if entry[0]:
+                        missed.append(entry)
+                else:
+                    self._units.move_to_end(key)
+                if entry[0] or final:
+                    break
+                last += 1
+            groups.append((start, entry))
+            first = last
+        while len(self._units) > self.cache_size:
+            self._units.popitem(last=False)
+
+        to_tag = [(entry, i) for entry in missed for i in entry[5]]
+        self._stats["sentences_tagged"] += len(to_tag)
+        with self._timed(STAGE_TAGGING):
+            tagged = _tag_sentences([entry[4][i] for entry, i in to_tag])
+        for (entry, i), sentence_tags in zip(to_tag, tagged):
+            entry[3][i] = sentence_tags
+        for entry in missed:
+            entry[4] = entry[5] = None   # Only needed until tagged
+
+        # Shift the units into place
+        self.raw_candidates, self.raw_spans, self.pos_tags_lines, self._sentences = [], [], [], []
+        for start, entry in groups:
+            _, candidates, spans, tags, _, _, unit_sentences = entry
+            self.raw_candidates.extend(candidates)
+            self.raw_spans.extend((span_start + start, span_end + start) for span_start, span_end in spans)
+            self.pos_tags_lines.extend(tags)
+            self._sentences.extend(text[sentence_start + start:sentence_end + start]
+                                   for sentence_start, sentence_end in unit_sentences)
+        self._stats["sentences"] += len(self._sentences)
+        if self.trace_level != TRACE_OFF:
+            self.logs.append({"event": "IncrementalUpdate",
+                              "detail": f"Reused {len(groups) - len(missed)} of {len(groups)} sentence groups"})
+
+        counts = self._filter_incremental(text, sentence_spans)
+        self._emit_stats()
+        return counts
+
+    def _split_incremental(self, text):
+        """Sentence spans of text, splitting only the part that differs from the last text again"""
+        tokenizer = _sentence_tokenizer()
+        if self._previous is None:
+            return list(tokenizer.span_tokenize(text))
+        old_text, old_spans = self._previous[0], self._previous[1]
+        prefix = _common_prefix_length(old_text, text)
+        suffix = _common_suffix_length(old_text, text, min(len(old_text), len(text)) - prefix)
+        shift = len(text) - len(old_text)
+
+        # Keep the sentences inside the unchanged prefix and suffix, but one
+        # sentence away from the edit so its neighbours are split again too
+        left = bisect_right(old_spans, prefix, key=lambda span: span[1])
+        kept_left = old_spans[:max(0, left - 1)]
+        right = bisect_left(old_spans, len(old_text) - suffix, key=lambda span: span[0])
+        kept_right = [(start + shift, end + shift) for start, end in old_spans[right + 1:]]
+
+        window_start = old_spans[len(kept_left)][0] if kept_left else 0
+        window_end = kept_right[0][0] if kept_right else len(text)
+        middle = [(start + window_start, end + window_start)
+                  for start, end in tokenizer.span_tokenize(text[window_start:window_end])]
+        return kept_left + middle + kept_right
+
+    def _run_unit(self, text, start, end, final, engine, sentence_spans):
+        """Run the automaton over text[start:end] and prepare its sentences for tagging.
+
+        Returns the cache entry [clean, candidates, spans, tags, sentences,
+        selected, sentence spans], offsets relative to start. sentences and
+        selected are only kept until the selected sentences are tagged.
+        """
+        automaton = CompiledAutomaton(prescan=engine == ENGINE_PRESCAN)
+        candidates, spans = [], []
+        self._stats["chars"] += end - start
+        with self._timed(STAGE_AUTOMATON):
+            automaton.feed(text[start:end], candidates, spans)
+            if final:
+                automaton.finish(candidates, spans)
+        clean = final or (automaton.offset == Q_START * N_CLASSES and not automaton.held_words
+                          and not automaton.carry)
+        if not clean:
+            return [False, None, None, None, None, None, None]
+        unit_sentences = [(sentence_start - start, sentence_end - start) for sentence_start, sentence_end in sentence_spans]
+        sentences = [text[sentence_start + start:sentence_end + start] for sentence_start, sentence_end in unit_sentences]
+        selected = _overlapping(unit_sentences, self._spans_needing_tags(candidates, spans))
+        return [True, candidates, spans, [None] * len(sentences), sentences, selected, unit_sentences]
+
+    def _filter_incremental(self, text, sentence_spans):
+        """Post-process the raw candidates, reusing the last call's filter decisions where the tags allow"""
+        start = perf_counter()
+        old_map, old_decisions = ({}, {}) if self._previous is None else self._previous[2:]
+        self.token_tag_map = {}
+        for sentence_tags in self.pos_tags_lines:
+            if sentence_tags:
+                self._add_tags(sentence_tags)
+        # A decision only depends on the tags of the candidate's words
+        changed = {token for token, tag in self.token_tag_map.items() if old_map.get(token) != tag}
+        changed.update(token for token in old_map if token not in self.token_tag_map)
+
+        decisions = {}
+        for candidate in dict.fromkeys(self.raw_candidates):
+            if candidate in old_decisions and changed.isdisjoint(_candidate_words(candidate)):
+                decisions[candidate] = old_decisions[candidate]
+            else:
+                decisions[candidate] = self._check_candidate(candidate)
+
+        candidate_counts = self._count_decided(decisions)
+        self._previous = (text, sentence_spans, self.token_tag_map, decisions)
+        self._timings[STAGE_FILTERING] += perf_counter() - start
+        return candidate_counts
+
+    def _check_engine(self, engine):
+        engine = engine or self.engine
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine!r}")
+        return engine
+
+    def _run_automaton(self, text, engine):
+        """Fill raw_candidates and raw_spans with the selected engine"""
+        self._stats["chars"] += len(text)
+        with self._timed(STAGE_AUTOMATON):
+            if engine in (ENGINE_COMPILED, ENGINE_PRESCAN):
+                if self.trace_level != TRACE_OFF:
+                    self.logs.append({"event": "ProcessStart", "detail": "Starting compiled DFA processing"})
+                self.raw_spans = []
+                self.raw_candidates = run_compiled_dfa(text, self.raw_spans, prescan=engine == ENGINE_PRESCAN)
+            else:
+                self._run_reference_dfa(text)
+
+    def _run_reference_dfa(self, text):
+        """Run the per-character automaton over text, filling raw_candidates"""
         self.current_state = S_START
         self.current_buffer = ""
         self.word_buffer = []
         self.connecting_buffer = ""
+        self.position = 0
+        self.connecting_start = 0
         self.raw_candidates = []
-        self.logs.append({"event": "ProcessStart", "detail": "Starting character-based DFA processing"})
-        
+        self.raw_spans = []
+        if self.trace_level != TRACE_OFF:
+            self.logs.append({"event": "ProcessStart", "detail": "Starting character-based DFA processing"})
+        if self.trace_level == TRACE_FULL:
+            self._trace = TransitionTrace(text, self.raw_candidates)
+            self.logs.append(self._trace)
+
         # Process each character
         for char in text:
             self.process_char(char)
@@ -236,92 +1347,546 @@ class PlaceFinder:
         # End of text - check if we need to finalize a candidate
         if self.current_state in [S_CAPITAL, S_IN_WORD, S_SPACE, S_CONNECTING]:
             if self.current_buffer:
-                self.word_buffer.append(self.current_buffer)
+                self._push_word(self.current_buffer, self.buffer_start)
             if self.connecting_buffer and self.connecting_buffer.lower() in CONNECTING_WORDS:
-                self.word_buffer.append(self.connecting_buffer)
+                # Outside CONNECTING this is a lowercase run carried from START, which has no span
+                start = self.connecting_start if self.current_state == S_CONNECTING else None
+                self._push_word(self.connecting_buffer, start)
             
             if self.word_buffer:
-                result = self._finalize_candidate()
-                self._log_char_action("<<EOF>>", self.current_state, 
-                                     f"End of text. {result}", S_START)
-                
-        return self.post_process_candidates()
+                finalized = self._finalize_candidate()
+                if self._trace is not None:
+                    self._record_transition(self.current_state, R_EOF, finalized, new_state=S_START)
+
+        if self._trace is not None:
+            self._trace.pending_words = list(self.word_buffer)
+            self._trace = None
+        return self.raw_candidates
     
-    def post_process_candidates(self):
-        """Filter the raw candidates to remove unlikely place names"""
-        processed_candidates = []
-        self.logs.append({"event": "PostProcessingStart", "detail": f"Raw candidates: {self.raw_candidates}"})
-        
-        for candidate in self.raw_candidates:
-            # Check for duplicate words (e.g., "Singapore Singapore")
-            words = candidate.split()
-            if len(words) > 1 and len(set(words)) < len(words):
-                self.logs.append({"event": "PostProcessFilter", "candidate": candidate, 
-                                 "filter_type": "DuplicateWords", 
-                                 "detail": f"Detected repeated words in '{candidate}'"})
-                # Skip to next candidate if there are duplicates
+    def _find_gazetteer_matches(self, text):
+        """(start, end) of the known place names in text, none without a gazetteer"""
+        if self.gazetteer is None:
+            return []
+        with self._timed(STAGE_GAZETTEER):
+            return self.gazetteer.find_all(text)
+
+    def _tag_spans(self, text, matches):
+        """Sorted spans whose sentences need tags: the raw candidates whose decision depends on
+        them, and the known names of a single lowercase word, which only count as places when
+        tagged as proper nouns"""
+        spans = self._spans_needing_tags(self.raw_candidates, self.raw_spans)
+        lowercase = [(start, end) for start, end in matches
+                     if not any(char.isupper() or char.isspace() for char in text[start:end])]
+        if not lowercase:
+            return spans
+        return sorted(spans + lowercase)
+
+    def _spans_needing_tags(self, candidates, spans):
+        """Spans of the candidates whose decision depends on POS tags, see _needs_tags"""
+        with self._timed(STAGE_FILTERING):
+            needs = {candidate: self._needs_tags(candidate) for candidate in dict.fromkeys(candidates)}
+        return [span for span, candidate in zip(spans, candidates) if needs[candidate]]
+
+    def _add_gazetteer_matches(self, text, matches):
+        """Add the known place names matched in text to the raw candidates.
+
+        Runs after tagging, so that a known name only replaces the raw
+        candidates it overlaps when post-processing would reject all of
+        them (e.g. "United Kingdom and Walla Walla"). The sentences of
+        lowercase names must have been tagged too, see _tag_spans.
+        """
+        replaced = set()
+        added = []
+        i = 0
+        for start, end in matches:
+            while i < len(self.raw_spans) and self.raw_spans[i][1] <= start:
+                i += 1
+            overlapping = []
+            j = i
+            while j < len(self.raw_spans) and self.raw_spans[j][0] < end:
+                overlapping.append(j)
+                j += 1
+            if any(self._check_candidate(self.raw_candidates[k]) is None for k in overlapping):
                 continue
-                
-            # Length Filter
-            if len(candidate) < 2:
-                self.logs.append({"event": "PostProcessFilter", "candidate": candidate, 
-                                  "filter_type": "Length", "detail": "Filtered (length < 2)."})
+            name = " ".join(text[start:end].split())
+            if not self._is_plausible_known_name(name):
                 continue
+            replaced.update(overlapping)
+            added.append(((start, end), name))
+        if not added:
+            return
 
-            # Common Words Filter (whole candidate, if it's a single word)
-            words_in_candidate = candidate.split(' ')
-            if len(words_in_candidate) == 1 and candidate in COMMON_WORDS_EXCLUSION_SET:
-                self.logs.append({"event": "PostProcessFilter", "candidate": candidate, 
-                                 "filter_type": "CommonWord", "detail": "Filtered (single common word)."})
-                continue
+        self._stats["gazetteer_matches"] += len(added)
+        if self.trace_level != TRACE_OFF:
+            self.logs.append({"event": "GazetteerMatch",
+                              "detail": f"Added known places: {[candidate for _, candidate in added]}"})
+        entries = [entry for k, entry in enumerate(zip(self.raw_spans, self.raw_candidates)) if k not in replaced]
+        entries.extend(added)
+        entries.sort()
+        # New lists: a transition trace still refers to the automaton's own list
+        self.raw_spans = [span for span, _ in entries]
+        self.raw_candidates = [candidate for _, candidate in entries]
 
-            # First Word Filter
-            if len(words_in_candidate) > 1 and words_in_candidate[0] in COMMON_WORDS_EXCLUSION_SET:
-                # Allow if the common word is "The" and the place name is likely significant
-                if not (words_in_candidate[0].lower() == "the" and len(words_in_candidate) > 1):
-                    self.logs.append({"event": "PostProcessFilter", "candidate": candidate,
-                                     "filter_type": "FirstWordCommon", 
-                                     "detail": f"Filtered (common first word: '{words_in_candidate[0]}')."})
-                    continue
-            
-            # Last Word Filter (if last word is a common connecting word)
-            if len(words_in_candidate) > 1 and words_in_candidate[-1].lower() in CONNECTING_WORDS:
-                self.logs.append({"event": "PostProcessFilter", "candidate": candidate,
-                                 "filter_type": "LastWordConnector", 
-                                 "detail": f"Filtered (ends with connector: '{words_in_candidate[-1]}')."})
-                continue
-            
-            # POS Tag Validation - verify if main words in candidate are proper nouns
-            valid_place = False
-            for word in words_in_candidate:
-                # Skip connecting words
-                if word.lower() in CONNECTING_WORDS:
-                    continue
-                    
-                # Check if it's a potential place name token
-                if self._is_potential_place_token(word):
-                    valid_place = True
-                    break
-            
-            if not valid_place:
-                self.logs.append({"event": "PostProcessFilter", "candidate": candidate,
-                                 "filter_type": "POSTaggingCheck", 
-                                 "detail": f"Filtered (no proper noun tokens in '{candidate}')."})
+    def _is_plausible_known_name(self, name):
+        """Whether a known name as written in the text is likely a place there.
+
+        The gazetteer ignores case, so the word filters run on the words
+        capitalized (rejecting "of", "the" or "may" as well as "Of"), and a
+        single word with no capital must be tagged as a proper noun: "nice"
+        or "reading" alone are not evidence of Nice or Reading.
+        """
+        words = _candidate_words(name)
+        capitalized = tuple(word.capitalize() for word in words)
+        # Repeated words are fine in a known name, e.g. Walla Walla
+        if any(check(capitalized) for filter_type, check in FILTERS if filter_type != "DuplicateWords"):
+            return False
+        if len(words) == 1 and not any(char.isupper() for char in name):
+            return self.token_tag_map.get(name) in PROPER_NOUN_TAGS
+        return True
+
+    def _check_candidate(self, candidate):
+        """Return the filter type that rejects the candidate, or None to keep it"""
+        # Known places are kept as they are, unless the word filters reject them whatever their case
+        if self.gazetteer is not None and candidate in self.gazetteer and self._is_plausible_known_name(candidate):
+            return None
+        words = _candidate_words(candidate)
+        for filter_type, check in self._filter_stages:
+            if check(words):
+                return filter_type
+        return None
+
+    def _needs_tags(self, candidate):
+        """Whether _check_candidate looks up the tags of the candidate's words.
+
+        A known name only needs them when it is a single lowercase word, the
+        word filters never do, and the POS check only looks up words that
+        start with a capital. Everything else is decided before tagging, so
+        its sentences are not tagged.
+        """
+        words = _candidate_words(candidate)
+        if self.gazetteer is not None and candidate in self.gazetteer:
+            if len(words) == 1 and not any(char.isupper() for char in candidate):
+                return True
+            if self._is_plausible_known_name(candidate):
+                return False
+        if any(check(words) for _, check in self.filters):
+            return False
+        return any(word[:1].isupper() and word.lower() not in CONNECTING_WORDS for word in words)
+
+    def _fails_pos_check(self, words):
+        """POS Tag Validation - reject unless a word other than a connecting word could be a proper noun"""
+        for word in words:
+            if word.lower() in CONNECTING_WORDS:
                 continue
+            if self._is_potential_place_token(word):
+                return False
+        return True
+
+    def _decide(self, candidates):
+        """Filter decision of each distinct candidate, checked once however often it occurs"""
+        check = self._check_candidate
+        return {candidate: check(candidate) for candidate in dict.fromkeys(candidates)}
 
-            processed_candidates.append(candidate)
+    def _log_rejection(self, candidate, filter_type):
+        """Log a PostProcessFilter event for a rejected candidate"""
+        words = candidate.split(' ')
+        detail = self.filter_details[filter_type].format(candidate=candidate, first=words[0], last=words[-1])
+        self.logs.append({"event": "PostProcessFilter", "candidate": candidate,
+                          "filter_type": filter_type, "detail": detail})
 
-        # Count occurrences of each candidate
+    def _count_decided(self, decisions):
+        """Count the kept raw candidates and the rejections, logging them if asked"""
+        occurrences = Counter(self.raw_candidates)
         candidate_counts = {}
-        for pc in processed_candidates:
-            candidate_counts[pc] = candidate_counts.get(pc, 0) + 1
-        
-        self.logs.append({"event": "PostProcessingEnd", "final_candidates_counts": candidate_counts})
+        rejections = self._rejections
+        for candidate, count in occurrences.items():
+            filter_type = decisions[candidate]
+            if filter_type is None:
+                candidate_counts[candidate] = count
+            else:
+                rejections[filter_type] += count
+        if self.trace_level != TRACE_OFF:
+            if self.log_rejections:
+                for candidate in self.raw_candidates:
+                    filter_type = decisions[candidate]
+                    if filter_type is not None:
+                        self._log_rejection(candidate, filter_type)
+            self.logs.append({"event": "PostProcessingEnd", "final_candidates_counts": candidate_counts})
+        self._stats["raw_candidates"] += len(self.raw_candidates)
+        self._stats["kept_candidates"] += sum(candidate_counts.values())
         return candidate_counts
 
+    def post_process_candidates(self):
+        """Filter the raw candidates to remove unlikely place names"""
+        start = perf_counter()
+        if self.trace_level != TRACE_OFF:
+            self.logs.append({"event": "PostProcessingStart", "detail": f"Raw candidates: {self.raw_candidates}"})
+        candidate_counts = self._count_decided(self._decide(self.raw_candidates))
+        self._timings[STAGE_FILTERING] += perf_counter() - start
+        return candidate_counts
+
+    def find_place_spans(self, text, engine=None):
+        """Find places and return them as (start, end, name) tuples in text order.
+
+        Offsets come straight from the automaton; name is the candidate as
+        counted by find_places, so whitespace between its words is normalized
+        to single spaces while text[start:end] is the original text.
+        """
+        return self._kept_spans(self.find_places(text, engine))
+
+    def _kept_spans(self, counts):
+        """(start, end, name) of the raw candidates that made it into counts"""
+        return [(start, end, candidate)
+                for (start, end), candidate in zip(self.raw_spans, self.raw_candidates)
+                if candidate in counts]
+
+    def iter_candidates(self, counts):
+        """Yield (start, end, candidate, filter_type) for every raw candidate of the last
+        find_places call, in text order; filter_type is None for the ones kept in counts"""
+        decisions = {}
+        for (start, end), candidate in zip(self.raw_spans, self.raw_candidates):
+            if candidate in counts:
+                yield start, end, candidate, None
+                continue
+            if candidate not in decisions:
+                decisions[candidate] = self._check_candidate(candidate)
+            yield start, end, candidate, decisions[candidate]
+
+    def iter_places(self, source, chunk_size=STREAM_CHUNK_SIZE):
+        """Find places in a stream of text, yielding (start, end, name) as they are found.
+
+        source is a text file object, an iterable of str chunks or a str.
+        The compiled automaton carries its state across chunk boundaries and
+        sentences are tagged as soon as they are complete, so memory depends
+        on the longest sentence rather than the size of the input. Text with
+        no sentence break for MAX_SENTENCE_LENGTH characters (e.g. a log
+        file) is cut at its last line break or whitespace instead.
+
+        Candidates are validated against the tags of the sentences around
+        them instead of a map of the whole document, and nothing is logged
+        or kept in pos_tags_lines. A gazetteer is used to validate candidates
+        but the stream is not searched for known names the automaton misses.
+        """
+        tokenizer = _sentence_tokenizer()
+        automaton = CompiledAutomaton(prescan=self.engine == ENGINE_PRESCAN)
+        raw_candidates, raw_spans = [], []
+        pending = deque()    # (start, end, candidate) waiting for their sentences to be tagged
+        buffer = ""          # Text not yet split into complete sentences
+        buffer_start = 0     # Absolute offset of buffer
+        scanned = 0          # Length of buffer already split without finding a complete sentence
+        self.logs = []
+        self.pos_tags_lines = []
+        self.token_tag_map = {}
+        self._reset_stats()
+
+        for chunk in _iter_chunks(source, chunk_size):
+            with self._timed(STAGE_AUTOMATON):
+                automaton.feed(chunk, raw_candidates, raw_spans)
+            self._stats["chars"] += len(chunk)
+            buffer += chunk
+
+            # All sentences but the last are complete; only look at whole tokens, and only
+            # split again the end of the text a previous chunk left in one sentence
+            with self._timed(STAGE_SENTENCE_SPLIT):
+                last_space = max(buffer.rfind(" "), buffer.rfind("\n"))
+                sentence_spans = []
+                if last_space >= scanned:
+                    base = max(0, scanned - SENTENCE_CONTEXT)
+                    sentence_spans = [(start + base, end + base)
+                                      for start, end in tokenizer.span_tokenize(buffer[base:last_space + 1])]
+                    if base and sentence_spans:
+                        # The first sentence starts the buffer, before the part split again
+                        sentence_spans[0] = (0, sentence_spans[0][1])
+                    scanned = last_space + 1
+            if len(sentence_spans) < 2:
+                if len(buffer) <= MAX_SENTENCE_LENGTH:
+                    continue
+                # No sentence break in too long a text: end a sentence at the last line break
+                # or else the last whitespace, splitting a token only when there is neither
+                cut = buffer.rfind("\n") + 1 or last_space + 1 or len(buffer)
+                sentence_spans = [(0, cut), (cut, len(buffer))]
+            cut = sentence_spans[-1][0]
+            pending.extend((start, end, candidate) for (start, end), candidate in zip(raw_spans, raw_candidates))
+            raw_candidates.clear()
+            raw_spans.clear()
+
+            # Tag the complete sentences that a pending candidate needing tags or an unfinished one reaches into
+            spans = self._pending_tag_spans(pending, buffer_start)
+            spans.append((automaton.sequence_start - buffer_start, cut))
+            sentences = [buffer[start:end] for start, end in sentence_spans[:-1]]
+            selected = _overlapping(sentence_spans[:-1], spans)
+            self._stats["sentences"] += len(sentences)
+            self._stats["sentences_tagged"] += len(selected)
+            with self._timed(STAGE_TAGGING):
+                tagged = _tag_sentences([sentences[i] for i in selected])
+            for sentence_tags in tagged:
+                self._add_tags(sentence_tags)
+            buffer = buffer[cut:]
+            buffer_start += cut
+            scanned = max(0, scanned - cut)
+
+            yield from self._release_candidates(pending, buffer_start)
+            # Tags of finished sentences are no longer needed once no candidate can reach back into them
+            if not pending and automaton.sequence_start >= buffer_start:
+                self.token_tag_map = {}
+
+        with self._timed(STAGE_AUTOMATON):
+            automaton.finish(raw_candidates, raw_spans)
+        pending.extend((start, end, candidate) for (start, end), candidate in zip(raw_spans, raw_candidates))
+        spans = self._pending_tag_spans(pending, buffer_start)
+        with self._timed(STAGE_SENTENCE_SPLIT):
+            sentences, selected = _select_sentences(buffer, spans)
+        self._stats["sentences"] += len(sentences)
+        self._stats["sentences_tagged"] += len(selected)
+        with self._timed(STAGE_TAGGING):
+            tagged = _tag_sentences([sentences[i] for i in selected])
+        for sentence_tags in tagged:
+            self._add_tags(sentence_tags)
+        yield from self._release_candidates(pending, None)
+        self.token_tag_map = {}
+        self._emit_stats()
+
+    def _pending_tag_spans(self, pending, buffer_start):
+        """Spans, relative to the buffer, of the pending candidates whose decision depends on tags"""
+        spans = self._spans_needing_tags([candidate for _, _, candidate in pending],
+                                         [(start, end) for start, end, _ in pending])
+        return [(start - buffer_start, end - buffer_start) for start, end in spans]
+
+    def _release_candidates(self, pending, tagged_until):
+        """Yield the pending candidates that end before tagged_until (all if None) and pass post-processing"""
+        while pending and (tagged_until is None or pending[0][1] <= tagged_until):
+            start, end, candidate = pending.popleft()
+            checked = perf_counter()
+            filter_type = self._check_candidate(candidate)
+            self._timings[STAGE_FILTERING] += perf_counter() - checked
+            self._stats["raw_candidates"] += 1
+            if filter_type is None:
+                self._stats["kept_candidates"] += 1
+                yield start, end, candidate
+            else:
+                self._rejections[filter_type] += 1
+
     def get_logs(self):
-        return self.logs
+        """Return the log of the last find_places call as a list of dicts.
+
+        Transitions recorded in a TransitionTrace are rendered here, so this
+        allocates one dict per character with TRACE_FULL. Iterate self.logs to
+        work with the compact trace instead.
+        """
+        logs = []
+        for entry in self.logs:
+            if isinstance(entry, TransitionTrace):
+                logs.extend(entry)
+            else:
+                logs.append(entry)
+        return logs
 
     def get_pos_tags_lines(self):
-        """Return the POS-tagged lines"""
-        return self.pos_tags_lines
\ No newline at end of file
+        """Return the POS-tagged lines, tagging the sentences find_places skipped"""
+        missing = [i for i, sentence_tags in enumerate(self.pos_tags_lines) if sentence_tags is None]
+        for i, sentence_tags in zip(missing, _tag_sentences([self._sentences[i] for i in missing])):
+            self.pos_tags_lines[i] = sentence_tags
+        return self.pos_tags_lines
+
+
+class PrometheusExporter:
+    """Metrics hook that adds up get_stats() of every call and renders them
+    in the Prometheus text exposition format.
+
+        exporter = PrometheusExporter()
+        finder = PlaceFinder(metrics_hook=exporter)
+        ...
+        body = exporter.render()   # serve at /metrics or write for the textfile collector
+
+    One exporter can be shared by finders in several threads.
+    """
+    def __init__(self, prefix="placefinder"):
+        self.prefix = prefix
+        self.calls = 0
+        self.counters = Counter()      # Keys from get_stats(), e.g. "chars"
+        self.rejections = Counter()    # Filter type -> rejected candidates
+        self.timings = Counter()       # Stage -> seconds
+        self._lock = threading.Lock()
+
+    def __call__(self, stats):
+        with self._lock:
+            self.calls += 1
+            self.counters.update({key: value for key, value in stats.items() if isinstance(value, int)})
+            self.rejections.update(stats["rejections"])
+            self.timings.update(stats["timings"])
+
+    def render(self):
+        """Return the totals so far as Prometheus text"""
+        with self._lock:
+            counters = [
+                ("calls_total", "Calls to find_places, find_places_batch and iter_places", {(): self.calls}),
+                ("chars_total", "Characters processed", {(): self.counters["chars"]}),
+                ("sentences_total", "Sentences split from the text", {(): self.counters["sentences"]}),
+                ("sentences_tagged_total", "Sentences POS-tagged", {(): self.counters["sentences_tagged"]}),
+                ("candidates_total", "Candidates found by the automaton, added from the gazetteer and kept",
+                 {(("kind", "raw"),): self.counters["raw_candidates"],
+                  (("kind", "kept"),): self.counters["kept_candidates"],
+                  (("kind", "gazetteer"),): self.counters["gazetteer_matches"]}),
+                ("rejections_total", "Candidates rejected, by post-processing filter",
+                 {(("filter_type", filter_type),): self.rejections[filter_type]
+                  for filter_type in dict.fromkeys([*FILTER_DETAILS, *self.rejections])}),
+                ("stage_seconds_total", "Time spent in each stage",
+                 {(("stage", stage),): self.timings[stage] for stage in STAGES}),
+            ]
+        lines = []
+        for name, help_text, samples in counters:
+            name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in samples.items():
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def highlight_places(text, spans, marker="**"):
+    """Return text with every (start, end, name) span wrapped in marker.
+
+    spans must be sorted and non-overlapping, as returned by find_place_spans.
+    Spans that cross line breaks are marked line by line so the markup
+    stays valid.
+    """
+    def mark(line):
+        word = line.strip()
+        if not word:
+            return line
+        lead = line.index(word)
+        return f"{line[:lead]}{marker}{word}{marker}{line[lead + len(word):]}"
+
+    parts = []
+    position = 0
+    for start, end, _ in spans:
+        parts.append(text[position:start])
+        parts.append("\n".join(mark(line) for line in text[start:end].split("\n")))
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+# Finder and result cache of the current worker process in corpus mode, see find_places_many
+_worker_finder = None
+_worker_cache = None
+
+
+def _init_worker(engine, gazetteer=None, cache=None, filters=None):
+    """Create the worker's finder and warm up the tokenizers and tagger"""
+    global _worker_finder, _worker_cache
+    ensure_nltk_resources(offline=True)
+    _worker_finder = PlaceFinder(engine=engine, trace_level=TRACE_OFF, gazetteer=gazetteer, filters=filters)
+    _worker_finder.find_places("Warm up the tagger in New York.")
+    _worker_cache = cache
+
+
+def _cached_results(finder, cache, texts):
+    """(counts, spans) of each text, from the cache or, for the texts not in it, from the finder"""
+    fingerprint = finder.config_fingerprint()
+    results = cache.get_many(texts, fingerprint)
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        computed = [(counts, finder._kept_spans(counts))
+                    for counts in finder._iter_batch([texts[i] for i in missing], None)]
+        finder._emit_stats()
+        cache.put_many([texts[i] for i in missing], computed, fingerprint)
+        for i, result in zip(missing, computed):
+            results[i] = result
+    else:
+        finder._reset_stats()
+    return results
+
+
+def _find_places_batch(batch, finder=None, cache=None):
+    """Run a finder (the worker's by default) over a batch of (doc_id, text) pairs, tagging them together"""
+    if finder is None:
+        finder, cache = _worker_finder, _worker_cache
+    doc_ids = [doc_id for doc_id, _ in batch]
+    texts = [text for _, text in batch]
+    if cache is None:
+        return list(zip(doc_ids, finder.find_places_batch(texts)))
+    return [(doc_id, counts) for doc_id, (counts, _) in zip(doc_ids, _cached_results(finder, cache, texts))]
+
+
+def _find_place_spans_batch(texts, finder=None, cache=None):
+    """Run a finder (the worker's by default) over texts, returning their spans and the finder's stats"""
+    if finder is None:
+        finder, cache = _worker_finder, _worker_cache
+    if cache is None:
+        return finder.find_place_spans_batch(texts), finder.get_stats()
+    return [spans for _, spans in _cached_results(finder, cache, texts)], finder.get_stats()
+
+
+def load_filters(reference):
+    """Filter specs for PlaceFinder(filters=...) from a "module:attribute" reference, e.g. "myfilters:FILTERS".
+
+    The attribute is a list of (filter_type, check, version[, detail[, before]])
+    tuples. Since the module is imported by name, worker processes can
+    unpickle its checks.
+    """
+    module_name, _, attribute = reference.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Expected module:attribute, got {reference!r}")
+    return list(getattr(importlib.import_module(module_name), attribute))
+
+
+def _document_batches(documents, batch_size):
+    """Group documents (texts or (doc_id, text) pairs) into lists of (doc_id, text)"""
+    documents = ((i, doc) if isinstance(doc, str) else doc for i, doc in enumerate(documents))
+    while True:
+        batch = list(islice(documents, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def find_places_many(documents, workers=None, engine=ENGINE_COMPILED, batch_size=CORPUS_BATCH_SIZE,
+                     totals=None, gazetteer=None, cache=None, filters=None):
+    """Run find_places over many documents on a pool of worker processes.
+
+    documents is an iterable of texts or (doc_id, text) pairs; a bare text
+    gets its position as id. Yields (doc_id, counts) in input order, as soon
+    as each document's batch is done, so the results are the same as a
+    serial loop. If totals is a Counter (or an aggregate.PlaceAggregator),
+    every document's counts are added to it as they arrive.
+
+    Each worker keeps one finder with a warmed-up tagger. workers defaults
+    to the number of CPUs; with workers=1 everything runs in this process.
+    At most two batches per worker are in flight, so documents are read
+    from the iterable only as fast as they are processed. A gazetteer is
+    reopened by each worker, which shares the memory-mapped file.
+
+    With a cache.ResultCache, documents whose text and finder configuration
+    are already in it are not processed again, and new results are added;
+    every worker reads and writes the cache database directly.
+
+    filters are registered on every worker's finder, as for PlaceFinder.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Download missing data once here rather than in every worker
+    ensure_nltk_resources()
+    batches = _document_batches(documents, batch_size)
+    if workers == 1:
+        finder = PlaceFinder(engine=engine, trace_level=TRACE_OFF, gazetteer=gazetteer, filters=filters)
+        results = (result for batch in batches for result in _find_places_batch(batch, finder, cache))
+    else:
+        results = _pool_results(batches, workers, engine, gazetteer, cache, filters)
+    for doc_id, counts in results:
+        if totals is not None:
+            totals.update(counts)
+        yield doc_id, counts
+
+
+def _pool_results(batches, workers, engine, gazetteer=None, cache=None, filters=None):
+    """Yield (doc_id, counts) from batches processed on a process pool, in order"""
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(engine, gazetteer, cache, filters)) as pool:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append(pool.apply_async(_find_places_batch, (batch,)))
+            if len(in_flight) >= 2 * workers:
+                yield from in_flight.popleft().get()
+        while in_flight:
+            yield from in_flight.popleft().get()
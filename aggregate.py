@@ -0,0 +1,184 @@
+"""Memory-bounded totals of place counts across a corpus.
+
+A PlaceAggregator adds up the counts returned by find_places, exactly,
+until the distinct names it holds would take more than its memory budget.
+It then turns into a summary of fixed size:
+
+- A count-min sketch of depth d = ceil(ln(1/delta)) and width w answers
+  count queries for any name. An estimate is never below the true count,
+  and with probability at least 1 - delta it is at most epsilon * N above
+  it, where N is the total of all counts and epsilon = e / w.
+- A Misra-Gries summary of top_k counters keeps the heavy hitters. Every
+  name counted more than N / (top_k + 1) times is in it, and its counter
+  is at most (N - counted) / (top_k + 1) below the true count, where
+  counted is the sum of the counters.
+
+w is picked so the sketch and the summary together fit the memory budget.
+Both structures are mergeable with the same guarantees, so aggregators
+built over shards of a corpus (e.g. on different workers or machines) can
+be combined with merge, as long as they share budget, top_k, delta and
+seed. Aggregators pickle as plain data.
+
+    totals = PlaceAggregator(memory_budget=256 << 20)
+    for doc_id, counts in find_places_many(documents, totals=totals):
+        ...
+    totals.most_common(20)
+"""
+import hashlib
+import heapq
+import math
+import sys
+from array import array
+from collections import Counter
+
+# Default memory budget in bytes
+DEFAULT_MEMORY_BUDGET = 64 << 20
+
+# Heavy hitters kept once counts are approximate
+DEFAULT_TOP_K = 1000
+
+# Probability that a sketch estimate is off by more than its error bound
+DEFAULT_DELTA = 0.01
+
+# Approximate bytes taken by one name in a dict of counts, besides the str itself:
+# the hash table slot, its share of the spare slots and the int
+ENTRY_BYTES = 100
+
+
+def _entry_size(name):
+    return sys.getsizeof(name) + ENTRY_BYTES
+
+
+class PlaceAggregator:
+    """Totals of place counts: exact within memory_budget bytes, then approximate with error bounds"""
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, top_k=DEFAULT_TOP_K, delta=DEFAULT_DELTA, seed=0):
+        if not 0 < delta < 1:
+            raise ValueError(f"delta must be between 0 and 1, got {delta}")
+        self.memory_budget = memory_budget
+        self.top_k = top_k
+        self.delta = delta
+        self.seed = seed
+        self.depth = math.ceil(math.log(1 / delta))
+        # The Misra-Gries summary holds up to 2 * top_k names between prunes
+        self.width = (memory_budget - 2 * top_k * _entry_size("x" * 32)) // (8 * self.depth)
+        if self.width < 1:
+            raise ValueError(f"A memory budget of {memory_budget} bytes is too small for top_k={top_k}")
+        self.total = 0           # N, the sum of all counts added
+        self.exact = True
+        self._counts = Counter()
+        self._bytes = 0          # Approximate memory held by _counts in exact mode
+        self._sketch = None      # Count-min sketch rows, one array of depth * width counters
+        self._heavy = None       # Misra-Gries counters, name -> count
+        self._heavy_counted = 0  # Sum of the Misra-Gries counters
+
+    @property
+    def epsilon(self):
+        """Relative error of sketch estimates: at most epsilon * total above the true count"""
+        return math.e / self.width
+
+    @property
+    def error_bound(self):
+        """Largest amount an estimate can exceed the true count by (with probability 1 - delta), 0 while exact"""
+        return 0 if self.exact else math.ceil(self.epsilon * self.total)
+
+    def update(self, counts):
+        """Add a dict of name -> count, such as find_places returns"""
+        if self.exact:
+            new = [name for name in counts if name not in self._counts]
+            self._bytes += sum(map(_entry_size, new))
+            self._counts.update(counts)
+            self.total += sum(counts.values())
+            if self._bytes > self.memory_budget:
+                self._to_sketch()
+            return
+        for name, count in counts.items():
+            self._add(name, count)
+        self.total += sum(counts.values())
+        self._prune()
+
+    def _to_sketch(self):
+        """Move the exact counts into the sketch and the heavy hitter summary"""
+        self.exact = False
+        self._sketch = array("q", bytes(8 * self.width * self.depth))
+        self._heavy = {}
+        self._heavy_counted = 0
+        counts, self._counts, self._bytes = self._counts, Counter(), 0
+        for name, count in counts.items():
+            self._add(name, count)
+        self._prune()
+
+    def _cells(self, name):
+        """Index of the name's counter in each row of the sketch"""
+        digest = hashlib.blake2b(name.encode("utf-8", "surrogatepass"), digest_size=16,
+                                 key=self.seed.to_bytes(8, "little")).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def _add(self, name, count):
+        sketch = self._sketch
+        for cell in self._cells(name):
+            sketch[cell] += count
+        self._heavy[name] = self._heavy.get(name, 0) + count
+        self._heavy_counted += count
+
+    def _prune(self, force=False):
+        """Shrink the Misra-Gries summary back to top_k counters once it has grown to twice that
+        (or, with force, as soon as it has more)"""
+        if len(self._heavy) <= self.top_k or (len(self._heavy) < 2 * self.top_k and not force):
+            return
+        # Take the (k+1)-th largest counter off every counter; at least k+1 counters
+        # lose that much, which is what bounds the error by (N - counted) / (k+1)
+        cut = heapq.nlargest(self.top_k + 1, self._heavy.values())[-1]
+        self._heavy = {name: count - cut for name, count in self._heavy.items() if count > cut}
+        self._heavy_counted = sum(self._heavy.values())
+
+    def merge(self, other):
+        """Add the counts of another aggregator (e.g. of another shard) to this one and return self"""
+        if (self.memory_budget, self.top_k, self.delta, self.seed) != \
+                (other.memory_budget, other.top_k, other.delta, other.seed):
+            raise ValueError("Only aggregators with the same memory_budget, top_k, delta and seed can be merged")
+        if other.exact:
+            self.update(other._counts)
+            return self
+        if self.exact:
+            self._to_sketch()
+        self._sketch = array("q", map(sum, zip(self._sketch, other._sketch)))
+        for name, count in other._heavy.items():
+            self._heavy[name] = self._heavy.get(name, 0) + count
+        self._heavy_counted += other._heavy_counted
+        self.total += other.total
+        self._prune(force=True)
+        return self
+
+    def bounds(self, name):
+        """(low, high) bounds of a name's true count; high holds with probability 1 - delta"""
+        if self.exact:
+            count = self._counts.get(name, 0)
+            return count, count
+        low = self._heavy.get(name, 0)
+        high = min(min(self._sketch[cell] for cell in self._cells(name)),
+                   low + (self.total - self._heavy_counted) // (self.top_k + 1))
+        return low, max(low, high)
+
+    def __getitem__(self, name):
+        """Count of a name: exact, or the upper bound of its estimate"""
+        return self.bounds(name)[1]
+
+    def most_common(self, n=None):
+        """(name, count) pairs, largest first. Approximate counts are upper bounds and only
+        cover the heavy hitters (names counted more than total / (top_k + 1) times are certain to be in)"""
+        if self.exact:
+            return self._counts.most_common(n)
+        estimates = [(name, self[name]) for name in self._heavy]
+        estimates.sort(key=lambda item: item[1], reverse=True)
+        return estimates if n is None else estimates[:n]
+
+    def summary(self):
+        """Description of the totals and their accuracy, as a JSON-ready dict"""
+        summary = {"exact": self.exact, "total": self.total}
+        if not self.exact:
+            summary.update(epsilon=self.epsilon, delta=self.delta, error_bound=self.error_bound,
+                           heavy_hitter_threshold=self.total // (self.top_k + 1))
+        return summary
@@ -1,13 +1,59 @@
 import streamlit as st
-from PlaceFinder import PlaceFinder
+from PlaceFinder import (ENGINE_COMPILED, TRACE_EVENTS, PlaceFinder, TransitionTrace, ensure_nltk_resources,
+                         highlight_places)
 import pandas as pd
 from annotated_text import annotated_text 
-import re
+from collections import Counter
+import math
 
 # Set page config to wide layout
 st.set_page_config(layout="wide")
 
-finder = PlaceFinder()
+PAGE_SIZES = [100, 500, 1000, 5000]
+
+
+@st.cache_resource
+def load_tagger():
+    """Check the NLTK data and load the tokenizer and tagger once per server process"""
+    ensure_nltk_resources()
+    PlaceFinder().find_places("Warm up the tagger in New York.")
+
+
+def session_finder():
+    """Incremental finder of this session: after an edit only the changed sentences are processed again"""
+    if "finder" not in st.session_state:
+        load_tagger()
+        st.session_state["finder"] = PlaceFinder(engine=ENGINE_COMPILED, trace_level=TRACE_EVENTS, incremental=True)
+    return st.session_state["finder"]
+
+
+# The trace is cached as a shared object rather than with st.cache_data, which
+# would pickle and copy the whole transition trace on every rerun
+@st.cache_resource(max_entries=4)
+def traced(text):
+    """Reference finder run over the text with every character transition recorded"""
+    load_tagger()
+    finder = PlaceFinder()
+    finder.find_places(text)
+    return finder
+
+
+@st.cache_data(max_entries=4)
+def logs_json(text):
+    return pd.DataFrame(traced(text).get_logs()).to_json(orient="records", indent=2)
+
+
+def pager(total, key):
+    """Page size and page number controls, returns the (start, end) rows to show"""
+    size_column, page_column, info_column = st.columns([1, 1, 2])
+    page_size = size_column.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}_size")
+    pages = max(1, math.ceil(total / page_size))
+    page = page_column.number_input("Page", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    start = (page - 1) * page_size
+    end = min(start + page_size, total)
+    info_column.caption(f"Rows {start + 1 if total else 0}-{end} of {total}")
+    return start, end
+
 
 st.title("Place Finder")
 
@@ -19,62 +65,40 @@ text_input = st.text_area("Enter text to analyze:", height=200, placeholder="E.g
 
 if st.button("Find Places"):
     if text_input:
+        # Keep the analyzed text so paging and other widgets can rerun the script without losing results
+        st.session_state["analyzed_text"] = text_input
+        st.session_state["export_requested"] = False
         with st.spinner("Processing..."):
-            results = finder.find_places(text_input)
-            logs = finder.get_logs()
-            pos_tags_lines = finder.get_pos_tags_lines()
+            st.session_state["spans"] = session_finder().find_place_spans(text_input)
+    else:
+        st.warning("Please enter some text to analyze.")
 
-        st.header("Results")
-        if results:
-            st.subheader("Text with Identified Places:")
-            
-            potential_highlights = []
-            sorted_place_names_for_rules = sorted(results.keys(), key=len, reverse=True)
-
-            for place_name_rule in sorted_place_names_for_rules:
-                place_escaped = re.escape(place_name_rule)
-                for match in re.finditer(place_escaped, text_input, flags=re.IGNORECASE):
-                    potential_highlights.append({
-                        'start': match.start(),
-                        'end': match.end(),
-                        'text': match.group(0),
-                        'priority': len(place_name_rule)
-                    })
-            
-            potential_highlights.sort(key=lambda h: (h['start'], -h['priority']))
-            
-            actual_highlights = []
-            last_highlight_end_pos = -1
-            for highlight in potential_highlights:
-                if highlight['start'] >= last_highlight_end_pos:
-                    actual_highlights.append(highlight)
-                    last_highlight_end_pos = highlight['end']
-
-            highlighted_parts = []
-            current_pos = 0
-            for highlight in actual_highlights:
-                if highlight['start'] > current_pos:
-                    highlighted_parts.append(text_input[current_pos:highlight['start']])
-                
-                highlighted_parts.append(f"**{highlight['text']}**")
-                current_pos = highlight['end']
-            
-            if current_pos < len(text_input):
-                highlighted_parts.append(text_input[current_pos:])
-            
-            highlighted_text = "".join(highlighted_parts)
-            
-            st.markdown(highlighted_text)     
-                   
-            st.subheader("Identified Place Candidates & Counts:")
-            for place, count in results.items():
-                st.write(f"- **{place}**: {count}")
-        else:
-            st.write("No place candidates found.")
+if "analyzed_text" in st.session_state:
+    analyzed_text = st.session_state["analyzed_text"]
+    finder = session_finder()
+    spans = st.session_state["spans"]
+    results = dict(Counter(name for _, _, name in spans))
 
-        with st.expander("View Part-of-Speech Tags", expanded=True):
-            st.subheader("Part-of-Speech Tags")
-            for i, line_tags in enumerate(pos_tags_lines):
+    st.header("Results")
+    if results:
+        st.subheader("Text with Identified Places:")
+        
+        highlighted_text = highlight_places(analyzed_text, spans)
+        
+        st.markdown(highlighted_text)     
+               
+        st.subheader("Identified Place Candidates & Counts:")
+        for place, count in results.items():
+            st.write(f"- **{place}**: {count}")
+    else:
+        st.write("No place candidates found.")
+
+    with st.expander("View Part-of-Speech Tags", expanded=True):
+        st.subheader("Part-of-Speech Tags")
+        if st.checkbox("Tag and show all sentences", key="show_pos_tags"):
+            pos_tags_lines = finder.get_pos_tags_lines()
+            start, end = pager(len(pos_tags_lines), "pos")
+            for line_tags in pos_tags_lines[start:end]:
                 if line_tags:
                     elements_for_annotated_text = []
                     for token, tag in line_tags:
@@ -92,36 +116,48 @@ if st.button("Find Places"):
                 else:
                     st.write("_Original line was empty or contained no processable tokens._")
             st.caption("Raw POS tags data (for debugging):")
-            st.json([{"line_number": i+1, "tags": tags} for i, tags in enumerate(pos_tags_lines)], expanded=False)
-
-
-        with st.expander("View DFA State Transitions Log", expanded=True):
-            st.subheader("DFA Processing Log")
-            
-            transition_logs = [
-                log for log in logs 
-                if "char" in log and "prev_state" in log and "new_state" in log and "action" in log
-            ]
-            
-            if transition_logs:
-                df_transitions = pd.DataFrame(transition_logs)
-                df_display = df_transitions[["char", "prev_state", "action", "new_state", "buffer", "word_buffer"]]
-                df_display.columns = ["Character", "Previous State", "Action/Details", "New State", "Current Buffer", "Word Buffer"]
-                st.dataframe(df_display, use_container_width=True)
-            else:
-                st.write("No detailed DFA transition logs available (or logs are not in the expected format).")
+            st.json([{"line_number": i+1, "tags": tags} for i, tags in enumerate(pos_tags_lines[start:end], start)],
+                    expanded=False)
+        else:
+            st.caption("Only sentences containing place candidates are tagged to find places.")
+
+
+    with st.expander("View DFA State Transitions Log", expanded=True):
+        st.subheader("DFA Processing Log")
         
-            st.caption("Full Raw Logs (for debugging):")
+        trace = None
+        if st.checkbox("Record character transitions", key="show_dfa"):
+            trace = next((entry for entry in traced(analyzed_text).logs if isinstance(entry, TransitionTrace)), None)
+
+        if trace is not None and len(trace):
+            start, end = pager(len(trace), "dfa")
+            # Only the rows of the current page are rendered from the trace
+            df_display = pd.DataFrame(trace[start:end], index=range(start, end))
+            df_display = df_display[["char", "prev_state", "action", "new_state", "buffer", "word_buffer"]]
+            df_display.columns = ["Character", "Previous State", "Action/Details", "New State", "Current Buffer", "Word Buffer"]
+            st.dataframe(df_display, use_container_width=True)
+        elif trace is not None:
+            st.write("No detailed DFA transition logs available (or logs are not in the expected format).")
+        else:
+            st.caption("Places are found with the compiled automaton, which does not record transitions; "
+                       "this reruns the reference automaton over the whole text.")
+    
+        st.caption("Processing Events (for debugging):")
+        st.json([entry for entry in finder.logs if isinstance(entry, dict)], expanded=False)
+        st.caption("Processing Stats (counters and stage timings in seconds):")
+        st.json(finder.get_stats(), expanded=False)
+
+        # Building the full JSON export reruns the reference automaton and renders every transition,
+        # so only do it when asked
+        if st.button("Prepare Full Logs for Download"):
+            st.session_state["export_requested"] = True
+        if st.session_state.get("export_requested"):
             st.download_button(
                 label="Download Logs as JSON",
-                data=pd.DataFrame(logs).to_json(orient="records", indent=2),
+                data=logs_json(analyzed_text),
                 file_name="dfa_logs.json",
                 mime="application/json"
             )
-            st.json(logs)
-
-    else:
-        st.warning("Please enter some text to analyze.")
 
 st.sidebar.header("How it Works (Simplified)")
 st.sidebar.markdown("""
@@ -0,0 +1,200 @@
+"""Benchmark suite for the stages of PlaceFinder.
+
+Times the reference automaton (process_char), the compiled automaton with
+and without the NumPy pre-scan, POS
+tagging, post-processing, the highlighter used by app.py and find_places end
+to end over a synthetic corpus. Reports chars/sec, latency percentiles and
+peak memory per stage, and writes them as JSON so runs can be compared.
+
+Runs offline: NLTK downloads are disabled, and the tagging stages are
+skipped if the NLTK data is not installed.
+
+    python benchmarks/bench.py --size 200000 --density 0.05 --output results.json
+    python benchmarks/bench.py --output new.json --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("PLACEFINDER_OFFLINE", "1")
+
+from corpus import generate_corpus  # noqa: E402
+from PlaceFinder import (ENGINE_COMPILED, TRACE_FULL, TRACE_OFF, PlaceFinder, ensure_nltk_resources,  # noqa: E402
+                         highlight_places, run_compiled_dfa)
+
+
+class Context:
+    """Corpus and the intermediate results the stages start from"""
+    def __init__(self, text, tagger_available):
+        self.text = text
+        self.tagger_available = tagger_available
+        finder = PlaceFinder(engine=ENGINE_COMPILED, trace_level=TRACE_OFF)
+        finder.raw_spans = []
+        finder.raw_candidates = run_compiled_dfa(text, finder.raw_spans)
+        if tagger_available:
+            finder._perform_pos_tagging(text, finder.raw_spans)
+        counts = finder.post_process_candidates()
+        self.finder = finder
+        self.spans = [(start, end, candidate) for (start, end), candidate
+                      in zip(finder.raw_spans, finder.raw_candidates) if candidate in counts]
+
+
+def stage_reference_dfa(ctx):
+    PlaceFinder(trace_level=TRACE_OFF)._run_reference_dfa(ctx.text)
+
+
+def stage_reference_dfa_traced(ctx):
+    PlaceFinder(trace_level=TRACE_FULL)._run_reference_dfa(ctx.text)
+
+
+def stage_compiled_dfa(ctx):
+    run_compiled_dfa(ctx.text, [])
+
+
+def stage_prescan_dfa(ctx):
+    run_compiled_dfa(ctx.text, [], prescan=True)
+
+
+def stage_pos_tagging(ctx):
+    ctx.finder._perform_pos_tagging(ctx.text, ctx.finder.raw_spans)
+
+
+def stage_pos_tagging_all(ctx):
+    ctx.finder._perform_pos_tagging(ctx.text)
+
+
+def stage_post_processing(ctx):
+    ctx.finder.post_process_candidates()
+
+
+def stage_highlight(ctx):
+    highlight_places(ctx.text, ctx.spans)
+
+
+def stage_find_places(ctx):
+    PlaceFinder(engine=ENGINE_COMPILED, trace_level=TRACE_OFF).find_places(ctx.text)
+
+
+# (name, function, needs the tagger)
+STAGES = [
+    ("reference_dfa", stage_reference_dfa, False),
+    ("reference_dfa_traced", stage_reference_dfa_traced, False),
+    ("compiled_dfa", stage_compiled_dfa, False),
+    ("prescan_dfa", stage_prescan_dfa, False),
+    ("pos_tagging", stage_pos_tagging, True),
+    ("pos_tagging_all_sentences", stage_pos_tagging_all, True),
+    ("post_processing", stage_post_processing, False),
+    ("highlight", stage_highlight, False),
+    ("find_places", stage_find_places, True),
+]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of values"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def measure(function, ctx, repeat):
+    """Time repeat runs after one warm-up, then one more run under tracemalloc for peak memory"""
+    function(ctx)
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(ctx)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(ctx)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(latencies)
+    return {
+        "runs": repeat,
+        "p50_ms": median * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "min_ms": min(latencies) * 1000,
+        "chars_per_sec": len(ctx.text) / median if median else None,
+        "peak_memory_bytes": peak,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def tagger_available():
+    try:
+        ensure_nltk_resources(offline=True)
+    except LookupError:
+        return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=200_000, help="Corpus size in characters")
+    parser.add_argument("--density", type=float, default=0.05, help="Probability that a word is a place name")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per stage")
+    parser.add_argument("--stages", nargs="*", default=None, help="Only run these stages")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    text = generate_corpus(args.size, args.density, args.seed)
+    ctx = Context(text, tagger_available())
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "tagger_available": ctx.tagger_available,
+        },
+        "corpus": {"size": len(text), "density": args.density, "seed": args.seed,
+                   "raw_candidates": len(ctx.finder.raw_candidates), "places": len(ctx.spans)},
+        "stages": {},
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["stages"]
+
+    for name, function, needs_tagger in STAGES:
+        if args.stages and name not in args.stages:
+            continue
+        if needs_tagger and not ctx.tagger_available:
+            results["stages"][name] = {"skipped": "NLTK data not installed"}
+            print(f"{name:<26} skipped (NLTK data not installed)")
+            continue
+        stats = measure(function, ctx, args.repeat)
+        results["stages"][name] = stats
+        line = (f"{name:<26} p50 {stats['p50_ms']:9.2f} ms  p90 {stats['p90_ms']:9.2f} ms  "
+                f"{stats['chars_per_sec'] / 1e6:7.2f} Mchar/s  peak {stats['peak_memory_bytes'] / 2**20:8.2f} MiB")
+        if baseline and "p50_ms" in baseline.get(name, {}):
+            line += f"  x{baseline[name]['p50_ms'] / stats['p50_ms']:.2f} vs baseline"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
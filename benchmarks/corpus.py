@@ -0,0 +1,47 @@
+"""Synthetic corpus generator for the benchmarks.
+
+Text is built from sentences of lowercase filler words, with place names
+mixed in at a controllable density. The same seed always gives the same text.
+"""
+import random
+
+FILLER_WORDS = [
+    "the", "a", "of", "and", "to", "in", "we", "walked", "along", "quiet", "road", "rain", "fell",
+    "while", "people", "talked", "about", "nothing", "particular", "market", "was", "busy", "with",
+    "traders", "selling", "fruit", "bread", "from", "early", "morning", "until", "late", "evening",
+    "train", "arrived", "after", "long", "delay", "near", "old", "bridge", "over", "river",
+]
+
+PLACE_NAMES = [
+    "Paris", "London", "Tokyo", "Kuala Lumpur", "New York City", "San Francisco", "Rio de Janeiro",
+    "the United Kingdom", "Bay of Bengal", "Gulf of Mexico", "Isle of Man", "Cape Town",
+    "Buenos Aires", "Lake Geneva", "Mount Kilimanjaro", "Sri Lanka", "Abu Dhabi", "Hong Kong",
+]
+
+SENTENCE_ENDINGS = [".", ".", ".", "!", "?"]
+
+
+def generate_sentence(rng, place_density, min_words=6, max_words=18):
+    """One sentence; each word slot is a place name with probability place_density"""
+    words = []
+    for _ in range(rng.randint(min_words, max_words)):
+        if rng.random() < place_density:
+            words.append(rng.choice(PLACE_NAMES))
+        else:
+            words.append(rng.choice(FILLER_WORDS))
+    words[0] = words[0][0].upper() + words[0][1:]
+    if rng.random() < 0.3:
+        words[rng.randrange(1, len(words))] += ","
+    return " ".join(words) + rng.choice(SENTENCE_ENDINGS)
+
+
+def generate_corpus(size, place_density=0.05, seed=0, paragraph_sentences=6):
+    """Return about size characters of text with the given place-name density"""
+    rng = random.Random(seed)
+    paragraphs = []
+    length = 0
+    while length < size:
+        paragraph = " ".join(generate_sentence(rng, place_density) for _ in range(paragraph_sentences))
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:size]
@@ -0,0 +1,120 @@
+"""Load generator for server.py.
+
+Keeps a number of keep-alive connections busy for a while, each sending
+requests back to back, then reports requests/sec and latency percentiles.
+
+    python server.py --port 8080 &
+    python benchmarks/load.py --port 8080 --concurrency 32 --duration 10
+    python benchmarks/load.py --port 8080 --batch 8 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench import percentile  # noqa: E402
+from corpus import generate_corpus  # noqa: E402
+
+
+async def read_response(reader):
+    """Read one HTTP response and return its status"""
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host, port, requests, deadline, latencies, statuses):
+    """Send requests round-robin over one connection until the deadline"""
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            writer.write(requests[i % len(requests)])
+            i += 1
+            start = time.perf_counter()
+            await writer.drain()
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+    finally:
+        writer.close()
+
+
+def build_requests(host, args):
+    """Pre-encoded HTTP requests over different synthetic texts"""
+    requests = []
+    for seed in range(args.texts):
+        if args.batch:
+            path = "/extract/batch"
+            documents = [generate_corpus(args.size, args.density, seed * args.batch + i) for i in range(args.batch)]
+            body = json.dumps({"documents": documents}).encode()
+        else:
+            path = "/extract"
+            body = json.dumps({"text": generate_corpus(args.size, args.density, seed)}).encode()
+        head = (f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n")
+        requests.append(head.encode() + body)
+    return requests
+
+
+async def run(args):
+    requests = build_requests(args.host, args)
+    latencies = []
+    statuses = Counter()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(client(args.host, args.port, requests, deadline, latencies, statuses)
+                           for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": args.concurrency,
+        "documents_per_request": args.batch or 1,
+        "text_size": args.size,
+        "requests": len(latencies),
+        "requests_per_sec": len(latencies) / elapsed,
+        "documents_per_sec": len(latencies) * (args.batch or 1) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "max_ms": max(latencies) * 1000 if latencies else None,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="Open connections")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="Seconds to send requests for")
+    parser.add_argument("--batch", type=int, default=0,
+                        help="Documents per /extract/batch request (default: single /extract requests)")
+    parser.add_argument("--size", type=int, default=2000, help="Characters per document")
+    parser.add_argument("--density", type=float, default=0.05, help="Probability that a word is a place name")
+    parser.add_argument("--texts", type=int, default=64, help="Different requests to cycle through")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    print(f"{result['requests']} requests  {result['requests_per_sec']:.1f} req/s  "
+          f"{result['documents_per_sec']:.1f} docs/s  p50 {result['p50_ms']:.1f} ms  "
+          f"p99 {result['p99_ms']:.1f} ms  statuses {result['statuses']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
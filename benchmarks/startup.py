@@ -0,0 +1,74 @@
+"""Startup benchmark: cold import and first-call latency of PlaceFinder.
+
+Every run starts a fresh interpreter, so nothing is cached in memory between
+runs. NLTK downloads are disabled; the data must already be installed.
+
+    python benchmarks/startup.py --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEXT = "I flew from Kuala Lumpur to the United Kingdom, then took a train to New York City."
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import PlaceFinder
+t1 = time.perf_counter()
+nltk_at_import = "nltk" in sys.modules
+PlaceFinder.ensure_nltk_resources()
+t2 = time.perf_counter()
+finder = PlaceFinder.PlaceFinder(engine=PlaceFinder.ENGINE_COMPILED, trace_level=PlaceFinder.TRACE_OFF)
+finder.find_places(sys.argv[1])
+t3 = time.perf_counter()
+finder.find_places(sys.argv[1])
+t4 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "resources": t2 - t1, "first_call": t3 - t2,
+                  "second_call": t4 - t3, "nltk_at_import": nltk_at_import}))
+"""
+
+STAGES = ["process", "import", "resources", "first_call", "second_call"]
+
+
+def run_once():
+    """Run the child in a fresh interpreter and return its stage timings"""
+    env = dict(os.environ, PLACEFINDER_OFFLINE="1")
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", CHILD, TEXT], cwd=ROOT, env=env,
+                               capture_output=True, text=True)
+    if completed.returncode:
+        sys.exit(completed.stderr.strip().splitlines()[-1])
+    timings = json.loads(completed.stdout.splitlines()[-1])
+    timings["process"] = time.perf_counter() - start
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    runs = [run_once() for _ in range(args.runs)]
+    summary = {stage: {"median_ms": statistics.median(run[stage] for run in runs) * 1000,
+                       "min_ms": min(run[stage] for run in runs) * 1000}
+               for stage in STAGES}
+    result = {"runs": args.runs, "nltk_at_import": any(run["nltk_at_import"] for run in runs),
+              "stages": summary}
+
+    for stage in STAGES:
+        print(f"{stage:<12} median {summary[stage]['median_ms']:9.1f} ms   min {summary[stage]['min_ms']:9.1f} ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
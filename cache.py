@@ -0,0 +1,218 @@
+"""Persistent cache of PlaceFinder results, stored in SQLite.
+
+Results are keyed by a hash of the document text and the fingerprint of
+the finder configuration (PlaceFinder.config_fingerprint), so a document
+is only processed again when its text or anything that decides the places
+found has changed. Each entry holds the document's counts and spans.
+
+The database is opened in WAL mode: any number of processes can read it
+while one writes, and writers wait for each other instead of failing.
+When the entries grow past max_bytes, the least recently used ones are
+evicted. Access times are only refreshed once they are ACCESS_REFRESH
+seconds old, so repeated hits stay read-only and eviction order is LRU to
+within that.
+
+    python cli.py corpus.jsonl --cache results.db
+    python cache.py results.db            # entries and size
+    python cache.py results.db --clear
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+# Default limit on the size of the cached results
+CACHE_MAX_BYTES = 1 << 30
+
+# Seconds a writer waits for another process to release the database
+BUSY_TIMEOUT = 60.0
+
+# Eviction removes entries until the size is below this fraction of max_bytes,
+# so it does not run again on every write once the cache is full
+EVICT_TO = 0.9
+
+# Seconds before a hit refreshes an entry's access time again; hits on recently used
+# entries are read-only and do not wait for the write lock
+ACCESS_REFRESH = 600.0
+
+# Entries are looked up this many at a time, below SQLite's limit on query parameters
+LOOKUP_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    doc_hash BLOB NOT NULL,
+    fingerprint TEXT NOT NULL,
+    counts TEXT NOT NULL,
+    spans TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (doc_hash, fingerprint)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta VALUES ('size', 0);
+CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN
+    UPDATE meta SET value = value + new.size WHERE key = 'size';
+END;
+CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN
+    UPDATE meta SET value = value - old.size WHERE key = 'size';
+END;
+CREATE TRIGGER IF NOT EXISTS results_update AFTER UPDATE OF size ON results BEGIN
+    UPDATE meta SET value = value - old.size + new.size WHERE key = 'size';
+END;
+"""
+
+
+@contextmanager
+def _transaction(connection):
+    """Write transaction that takes the database lock up front, waiting for other writers"""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+def document_hash(text):
+    """16-byte digest of a document's text"""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class ResultCache:
+    """SQLite-backed cache of (counts, spans) per document and finder configuration.
+
+    A ResultCache can be passed to worker processes: it pickles as its path
+    and limit, and every process opens its own connection.
+    """
+    def __init__(self, path, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+        self._connect()
+
+    def __reduce__(self):
+        return ResultCache, (self.path, self.max_bytes)
+
+    def _connect(self):
+        """The connection of the current process, opened (and the schema created) on first use"""
+        if self._pid != os.getpid():
+            # A connection must not be used across fork, so a child opens its own
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # IF NOT EXISTS makes this safe when several processes open a new database at once
+            connection.executescript(f"BEGIN IMMEDIATE;{SCHEMA}COMMIT;")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def get_many(self, texts, fingerprint):
+        """Return (counts, spans) for each text, or None where it is not cached"""
+        connection = self._connect()
+        hashes = [document_hash(text) for text in texts]
+        found = {}
+        stale = []
+        now = time.time()
+        for i in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[i:i + LOOKUP_CHUNK]
+            rows = connection.execute(
+                f"SELECT doc_hash, counts, spans, accessed FROM results WHERE fingerprint = ? "
+                f"AND doc_hash IN ({','.join('?' * len(chunk))})", (fingerprint, *chunk))
+            for doc_hash, counts, spans, accessed in rows:
+                found[doc_hash] = (json.loads(counts), [tuple(span) for span in json.loads(spans)])
+                if now - accessed > ACCESS_REFRESH:
+                    stale.append(doc_hash)
+        if stale:
+            with _transaction(connection):
+                connection.executemany("UPDATE results SET accessed = ? WHERE doc_hash = ? AND fingerprint = ?",
+                                       [(now, doc_hash, fingerprint) for doc_hash in stale])
+        results = [found.get(doc_hash) for doc_hash in hashes]
+        self.hits += len(results) - results.count(None)
+        self.misses += results.count(None)
+        return results
+
+    def put_many(self, texts, results, fingerprint):
+        """Store the (counts, spans) of each text, then evict entries if the cache is over its limit"""
+        connection = self._connect()
+        now = time.time()
+        rows = []
+        for text, (counts, spans) in zip(texts, results):
+            counts = json.dumps(counts, ensure_ascii=False, separators=(",", ":"))
+            spans = json.dumps(spans, ensure_ascii=False, separators=(",", ":"))
+            rows.append((document_hash(text), fingerprint, counts, spans, len(counts) + len(spans) + 64, now))
+        with _transaction(connection):
+            connection.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (doc_hash, fingerprint) DO UPDATE "
+                "SET counts = excluded.counts, spans = excluded.spans, size = excluded.size, "
+                "accessed = excluded.accessed", rows)
+            self._evict(connection)
+
+    def _evict(self, connection):
+        """Delete the least recently used entries while the cache is over max_bytes"""
+        size = self._size(connection)
+        if size <= self.max_bytes:
+            return
+        excess = size - int(self.max_bytes * EVICT_TO)
+        victims = []
+        for doc_hash, fingerprint, entry_size in connection.execute(
+                "SELECT doc_hash, fingerprint, size FROM results ORDER BY accessed"):
+            victims.append((doc_hash, fingerprint))
+            excess -= entry_size
+            if excess <= 0:
+                break
+        connection.executemany("DELETE FROM results WHERE doc_hash = ? AND fingerprint = ?", victims)
+
+    @staticmethod
+    def _size(connection):
+        return connection.execute("SELECT value FROM meta WHERE key = 'size'").fetchone()[0]
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    @property
+    def size(self):
+        """Bytes of cached results counted against max_bytes"""
+        return self._size(self._connect())
+
+    def clear(self):
+        connection = self._connect()
+        with _transaction(connection):
+            connection.execute("DELETE FROM results")
+        connection.execute("VACUUM")
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection, self._pid = None, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear a PlaceFinder result cache")
+    parser.add_argument("path", help="Cache database file")
+    parser.add_argument("--clear", action="store_true", help="Delete every cached result")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+    with ResultCache(args.path) as cache:
+        if args.clear:
+            cache.clear()
+        print(f"{len(cache)} results, {cache.size} bytes", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import sys
+
+from PlaceFinder import ENGINE_COMPILED, ENGINES, find_places_many, load_filters
+from aggregate import DEFAULT_MEMORY_BUDGET, DEFAULT_TOP_K, PlaceAggregator
+from cache import CACHE_MAX_BYTES, ResultCache
+from export import EXPORT_FORMATS, export_places
+from gazetteer import Gazetteer
+
+
+def iter_directory(path):
+    """Yield (relative path, text) for every file under a directory, in sorted order"""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            with open(file_path, encoding="utf-8", errors="replace") as f:
+                yield os.path.relpath(file_path, path), f.read()
+
+
+def iter_jsonl(path, text_field, id_field):
+    """Yield (id, text) for every record of a JSONL file; the id defaults to the line number"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield record.get(id_field, line_number), record[text_field]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find place names in a corpus of documents.")
+    parser.add_argument("input", help="Directory of text files or a JSONL file with one document per line")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINE_COMPILED)
+    parser.add_argument("--text-field", default="text", help="JSONL field holding the document text")
+    parser.add_argument("--id-field", default="id", help="JSONL field holding the document id")
+    parser.add_argument("--gazetteer", default=None,
+                        help="Gazetteer file of known place names, built with gazetteer.py")
+    parser.add_argument("--filters", default=None,
+                        help="Extra post-processing filters as module:attribute, a list of "
+                             "(filter_type, check, version) tuples")
+    parser.add_argument("--cache", default=None,
+                        help="SQLite file of earlier results; unchanged documents are not processed again")
+    parser.add_argument("--cache-size", type=float, default=CACHE_MAX_BYTES / 2**20,
+                        help="Megabytes of results kept in the cache before the least recently used are evicted")
+    parser.add_argument("--memory-budget", type=float, default=DEFAULT_MEMORY_BUDGET / 2**20,
+                        help="Megabytes for exact corpus totals; past it the totals are approximate")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K,
+                        help="Most frequent places kept once the totals are approximate")
+    parser.add_argument("--export", default=None,
+                        help="Also write every place, rejected candidate and (with --export-traces) automaton "
+                             "transition to this .jsonl, .parquet or .arrow file; runs in this process")
+    parser.add_argument("--export-format", choices=EXPORT_FORMATS, default=None,
+                        help="Format of --export (default: from its extension)")
+    parser.add_argument("--export-traces", action="store_true",
+                        help="Run the reference automaton and export its transitions too")
+    parser.add_argument("-o", "--output", default="-",
+                        help="Where to write per-document results as JSONL (default: stdout)")
+    parser.add_argument("--totals", default=None,
+                        help="Where to write the corpus-level counts as JSON (default: stderr)")
+    args = parser.parse_args(argv)
+    if args.export and args.workers not in (None, 1):
+        parser.error("--export runs in this process and cannot be combined with --workers")
+    if args.export and args.cache:
+        parser.error("--export processes every document and cannot be combined with --cache")
+
+    if os.path.isdir(args.input):
+        documents = iter_directory(args.input)
+    else:
+        documents = iter_jsonl(args.input, args.text_field, args.id_field)
+
+    gazetteer = Gazetteer(args.gazetteer) if args.gazetteer else None
+    filters = load_filters(args.filters) if args.filters else None
+    cache = ResultCache(args.cache, int(args.cache_size * 2**20)) if args.cache else None
+    totals = PlaceAggregator(int(args.memory_budget * 2**20), args.top_k)
+    document_count = 0
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    if args.export:
+        results = export_places(documents, args.export, args.export_format, args.engine, args.export_traces,
+                                gazetteer, totals=totals, filters=filters)
+    else:
+        results = find_places_many(documents, workers=args.workers, engine=args.engine,
+                                   totals=totals, gazetteer=gazetteer, cache=cache, filters=filters)
+    try:
+        for doc_id, counts in results:
+            output.write(json.dumps({"id": doc_id, "places": counts}, ensure_ascii=False) + "\n")
+            document_count += 1
+    finally:
+        # Closing the generator also finishes the export file
+        results.close()
+        if output is not sys.stdout:
+            output.close()
+
+    summary = {"documents": document_count, "places": dict(totals.most_common())}
+    if not totals.exact:
+        summary["accuracy"] = totals.summary()
+    if args.totals:
+        with open(args.totals, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(summary, sys.stderr, ensure_ascii=False, indent=2)
+        sys.stderr.write("\n")
+
+
+if __name__ == "__main__":
+    main()
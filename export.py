@@ -0,0 +1,265 @@
+"""Streaming export of PlaceFinder results and automaton traces.
+
+Every document adds rows of one of three kinds:
+
+    place        a kept candidate: offset, end, candidate
+    rejected     a filtered candidate: offset, end, candidate, filter_type
+    transition   one step of the reference automaton: offset, prev_state,
+                 new_state, action (codes as in TransitionTrace, with the
+                 R_FINALIZED flag set when a candidate was finalized)
+
+Rows are written as JSONL, one object per row with only the fields of its
+kind, or as Arrow/Parquet with the typed columns of SCHEMA_FIELDS (null
+where a kind has no value). Rows are written in batches of batch_rows as
+documents are processed, so memory stays flat however large the output
+grows; only the trace of the current document is held, in the compact form
+the automaton records. Load the output back with e.g.
+
+    pyarrow.parquet.read_table("places.parquet", filters=[("kind", "=", "rejected")])
+    pyarrow.ipc.open_file("trace.arrow").read_all()
+
+Arrow and Parquet need pyarrow, which is only imported when used.
+"""
+import json
+import os
+
+from PlaceFinder import (CORPUS_BATCH_SIZE, ENGINE_COMPILED, ENGINE_REFERENCE, FILTER_DETAILS, TRACE_FULL,
+                         TRACE_OFF, PlaceFinder, TransitionTrace, _document_batches, ensure_nltk_resources)
+
+FORMAT_JSONL = "jsonl"
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"      # Arrow IPC file, e.g. for pyarrow.ipc.open_file or pandas.read_feather
+EXPORT_FORMATS = (FORMAT_JSONL, FORMAT_PARQUET, FORMAT_ARROW)
+EXTENSIONS = {".jsonl": FORMAT_JSONL, ".ndjson": FORMAT_JSONL, ".parquet": FORMAT_PARQUET,
+              ".arrow": FORMAT_ARROW, ".feather": FORMAT_ARROW}
+
+# Rows per written batch (and per Parquet row group)
+EXPORT_BATCH_ROWS = 1 << 17
+
+KIND_PLACE = "place"
+KIND_REJECTED = "rejected"
+KIND_TRANSITION = "transition"
+KINDS = (KIND_PLACE, KIND_REJECTED, KIND_TRANSITION)
+# Dictionary columns use fixed dictionaries, which an Arrow IPC file needs across batches;
+# these are the filter types unless a finder registered more
+FILTER_TYPES = tuple(FILTER_DETAILS)
+
+# (name, Arrow type) of the exported columns; type names are resolved when pyarrow is imported
+SCHEMA_FIELDS = [
+    ("doc_id", "string"),
+    ("kind", "dictionary<int8, string>"),
+    ("offset", "int64"),
+    ("end", "int64"),
+    ("candidate", "string"),
+    ("filter_type", "dictionary<int8, string>"),
+    ("prev_state", "int8"),
+    ("new_state", "int8"),
+    ("action", "int8"),
+]
+
+
+def _arrow_schema(pa):
+    types = {"string": pa.string(), "int64": pa.int64(), "int8": pa.int8(),
+             "dictionary<int8, string>": pa.dictionary(pa.int8(), pa.string())}
+    return pa.schema([(name, types[type_name]) for name, type_name in SCHEMA_FIELDS])
+
+
+def _trace(finder):
+    return next((entry for entry in finder.logs if isinstance(entry, TransitionTrace)), None)
+
+
+class JSONLExporter:
+    """Writes rows as JSON lines, one per row"""
+    def __init__(self, path, batch_rows=EXPORT_BATCH_ROWS):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write_document(self, doc_id, finder, counts):
+        """Write the candidates of the finder's last call (and its trace, if it recorded one)"""
+        prefix = '{"doc_id":' + json.dumps(doc_id, ensure_ascii=False)
+        lines = []
+        for start, end, candidate, filter_type in finder.iter_candidates(counts):
+            candidate = json.dumps(candidate, ensure_ascii=False)
+            if filter_type is None:
+                lines.append(f'{prefix},"kind":"place","offset":{start},"end":{end},"candidate":{candidate}}}\n')
+            else:
+                filter_type = json.dumps(filter_type, ensure_ascii=False)
+                lines.append(f'{prefix},"kind":"rejected","offset":{start},"end":{end},"candidate":{candidate},'
+                             f'"filter_type":{filter_type}}}\n')
+            if len(lines) >= self.batch_rows:
+                self._write(lines)
+                lines = []
+        self._write(lines)
+
+        trace = _trace(finder)
+        if trace is None:
+            return
+        for start in range(0, len(trace), self.batch_rows):
+            rows = trace.rows[start * trace.ROW_SIZE:(start + self.batch_rows) * trace.ROW_SIZE]
+            self._write([f'{prefix},"kind":"transition","offset":{offset},"prev_state":{prev_state},'
+                         f'"new_state":{new_state},"action":{action}}}\n'
+                         for prev_state, new_state, action, offset in zip(rows[0::trace.ROW_SIZE],
+                                                                          rows[1::trace.ROW_SIZE],
+                                                                          rows[2::trace.ROW_SIZE],
+                                                                          rows[3::trace.ROW_SIZE])])
+
+    def _write(self, lines):
+        self._file.writelines(lines)
+        self.rows += len(lines)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ArrowExporter:
+    """Writes rows as record batches to a Parquet file or an Arrow IPC file"""
+    def __init__(self, path, format=FORMAT_PARQUET, batch_rows=EXPORT_BATCH_ROWS, filter_types=FILTER_TYPES):
+        import pyarrow as pa
+
+        self.path = path
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self._pa = pa
+        self.schema = _arrow_schema(pa)
+        if format == FORMAT_PARQUET:
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self._writer = pa.ipc.new_file(path, self.schema)
+        self.filter_types = tuple(filter_types)
+        self._filter_codes = {filter_type: i for i, filter_type in enumerate(self.filter_types)}
+        self._pending = self._new_pending()
+
+    @staticmethod
+    def _new_pending():
+        return {name: [] for name in ("doc_id", "kind", "offset", "end", "candidate", "filter_type")}
+
+    def _dictionary(self, codes, values):
+        return self._pa.DictionaryArray.from_arrays(self._pa.array(codes, self._pa.int8()), values)
+
+    def write_document(self, doc_id, finder, counts):
+        """Write the candidates of the finder's last call (and its trace, if it recorded one)"""
+        doc_id = str(doc_id)
+        pending = self._pending
+        for start, end, candidate, filter_type in finder.iter_candidates(counts):
+            pending["doc_id"].append(doc_id)
+            pending["kind"].append(KINDS.index(KIND_PLACE if filter_type is None else KIND_REJECTED))
+            pending["offset"].append(start)
+            pending["end"].append(end)
+            pending["candidate"].append(candidate)
+            pending["filter_type"].append(None if filter_type is None else self._filter_codes[filter_type])
+            if len(pending["doc_id"]) >= self.batch_rows:
+                self._flush()
+                pending = self._pending
+
+        trace = _trace(finder)
+        if trace is None:
+            return
+        self._flush()
+        pa = self._pa
+        row_size = trace.ROW_SIZE
+        for start in range(0, len(trace), self.batch_rows):
+            rows = trace.rows[start * row_size:(start + self.batch_rows) * row_size]
+            length = len(rows) // row_size
+
+            def column(index, type):
+                # Strided copy of one column, handed to Arrow without going through Python ints
+                values = rows[index::row_size]
+                return pa.Array.from_buffers(pa.int64(), length, [None, pa.py_buffer(values)]).cast(type)
+
+            self._write_batch(pa.record_batch([
+                pa.repeat(pa.scalar(doc_id), length),
+                self._dictionary([KINDS.index(KIND_TRANSITION)] * length, KINDS),
+                column(3, pa.int64()),
+                pa.nulls(length, pa.int64()),
+                pa.nulls(length, pa.string()),
+                self._dictionary([None] * length, self.filter_types),
+                column(0, pa.int8()),
+                column(1, pa.int8()),
+                column(2, pa.int8()),
+            ], schema=self.schema))
+
+    def _flush(self):
+        if not self._pending["doc_id"]:
+            return
+        pa = self._pa
+        pending = self._pending
+        length = len(pending["doc_id"])
+        self._write_batch(pa.record_batch([
+            pa.array(pending["doc_id"], pa.string()),
+            self._dictionary(pending["kind"], KINDS),
+            pa.array(pending["offset"], pa.int64()),
+            pa.array(pending["end"], pa.int64()),
+            pa.array(pending["candidate"], pa.string()),
+            self._dictionary(pending["filter_type"], self.filter_types),
+            pa.nulls(length, pa.int8()),
+            pa.nulls(length, pa.int8()),
+            pa.nulls(length, pa.int8()),
+        ], schema=self.schema))
+        self._pending = self._new_pending()
+
+    def _write_batch(self, batch):
+        self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_exporter(path, format=None, batch_rows=EXPORT_BATCH_ROWS, filter_types=FILTER_TYPES):
+    """Exporter for path, in the given format or the one its extension names"""
+    if format is None:
+        format = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if format is None:
+            raise ValueError(f"Cannot tell the export format of {path}; pass one of {', '.join(EXPORT_FORMATS)}")
+    if format == FORMAT_JSONL:
+        return JSONLExporter(path, batch_rows)
+    if format in (FORMAT_PARQUET, FORMAT_ARROW):
+        return ArrowExporter(path, format, batch_rows, filter_types)
+    raise ValueError(f"Unknown export format: {format!r}")
+
+
+def export_places(documents, path, format=None, engine=ENGINE_COMPILED, traces=False, gazetteer=None,
+                  batch_rows=EXPORT_BATCH_ROWS, totals=None, filters=None):
+    """Run a finder over documents in this process, exporting every document's rows to path.
+
+    documents is an iterable of texts or (doc_id, text) pairs, as for
+    find_places_many, and (doc_id, counts) is yielded for each in order.
+    With traces, the reference automaton runs with TRACE_FULL and every
+    transition is exported too; otherwise documents are tagged in batches.
+    filters are registered on the finder, as for PlaceFinder.
+    The output is complete once the generator is exhausted or closed.
+    """
+    ensure_nltk_resources()
+    if traces:
+        finder = PlaceFinder(engine=ENGINE_REFERENCE, trace_level=TRACE_FULL, gazetteer=gazetteer,
+                             filters=filters)
+    else:
+        finder = PlaceFinder(engine=engine, trace_level=TRACE_OFF, gazetteer=gazetteer, filters=filters)
+    with open_exporter(path, format, batch_rows, finder.filter_details) as exporter:
+        for batch in _document_batches(documents, 1 if traces else CORPUS_BATCH_SIZE):
+            if traces:
+                results = [finder.find_places(batch[0][1])]
+            else:
+                results = finder._iter_batch([text for _, text in batch], None)
+            for (doc_id, _), counts in zip(batch, results):
+                exporter.write_document(doc_id, finder, counts)
+                if totals is not None:
+                    totals.update(counts)
+                yield doc_id, counts
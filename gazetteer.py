@@ -0,0 +1,239 @@
+"""Gazetteer of known place names for PlaceFinder.
+
+Names are stored in an Aho-Corasick automaton over their characters, laid
+out as flat arrays in one file. The file is memory-mapped read-only, so it
+is loaded without parsing and the pages are shared by every process that
+opens it (e.g. the workers of find_places_many).
+
+Lookups of a name take O(len(name)), and find_all matches every known name,
+multi-word ones included, in a single pass over a text.
+
+Build the file once, from a plain list of names or a GeoNames dump:
+
+    python gazetteer.py names.txt places.gaz
+    python gazetteer.py --geonames allCountries.txt places.gaz
+
+then pass Gazetteer("places.gaz") to PlaceFinder.
+"""
+import argparse
+import mmap
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+MAGIC = b"PFGAZ1" + (b"LE" if sys.byteorder == "little" else b"BE")
+HEADER = struct.Struct("<8sIIII")   # magic, nodes, edges, longest name, names
+# Per-node arrays, then the per-edge arrays, all uint32 in file order
+NODE_ARRAYS = ("edge_start", "edge_count", "fail", "out", "depth")
+EDGE_ARRAYS = ("labels", "targets")
+
+_WHITESPACE = re.compile(r"\s")
+
+
+def normalize_name(name):
+    """Lowercase a name and collapse its whitespace to single spaces"""
+    return " ".join(name.lower().split())
+
+
+def _normalize_text(text):
+    """Lowercase text and turn every whitespace char into a space, keeping offsets unchanged"""
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # A few characters lowercase to more than one (e.g. 'İ'); keep those as they are
+        lowered = "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+    return _WHITESPACE.sub(" ", lowered)
+
+
+def build(names, path):
+    """Write a gazetteer file of names (an iterable of str) to path and return it opened.
+
+    Names are normalized with normalize_name. The trie is laid out level by
+    level straight from the sorted names, so building needs memory for the
+    names and the output arrays but not for a tree of node objects.
+    """
+    names = sorted({normalized for normalized in map(normalize_name, names) if normalized})
+    node = {name: array("I") for name in NODE_ARRAYS}
+    labels, targets = array("I"), array("I")
+    longest = max(map(len, names), default=0)
+
+    def goto(state, label):
+        start = node["edge_start"][state]
+        end = start + node["edge_count"][state]
+        i = bisect_left(labels, label, start, end)
+        return targets[i] if i < end and labels[i] == label else None
+
+    def add_node(fail, terminal, depth):
+        state = len(node["fail"])
+        node["fail"].append(fail)
+        node["out"].append(state if terminal else node["out"][fail])
+        node["depth"].append(depth)
+        return state
+
+    for name in ("fail", "out", "depth"):
+        node[name].append(0)   # Root
+    frontier = deque([(0, len(names))])   # Names below each node not yet expanded, in node order
+    state = 0
+    while frontier:
+        lo, hi = frontier.popleft()
+        depth = node["depth"][state]
+        if lo < hi and len(names[lo]) == depth:
+            lo += 1   # The node's own name sorts first
+        node["edge_start"].append(len(labels))
+        node["edge_count"].append(0)
+        while lo < hi:
+            char = names[lo][depth]
+            group_end = bisect_right(names, names[lo][:depth + 1] + "\U0010ffff", lo, hi)
+            label = ord(char)
+            # Fail link: longest proper suffix of the child's prefix that is also a prefix
+            fail = 0
+            if state:
+                fail = node["fail"][state]
+                while goto(fail, label) is None and fail:
+                    fail = node["fail"][fail]
+                fail = goto(fail, label) or 0
+            child = add_node(fail, len(names[lo]) == depth + 1, depth + 1)
+            labels.append(label)
+            targets.append(child)
+            node["edge_count"][state] += 1
+            frontier.append((lo, group_end))
+            lo = group_end
+        state += 1
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(node["fail"]), len(labels), longest, len(names)))
+        for name in NODE_ARRAYS:
+            node[name].tofile(f)
+        labels.tofile(f)
+        targets.tofile(f)
+    return Gazetteer(path)
+
+
+class Gazetteer:
+    """Read-only, memory-mapped set of place names with single-pass text matching"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, nodes, edges, self.longest, self._names = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer file for this platform (magic {magic!r})")
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+        for name, count in [(name, nodes) for name in NODE_ARRAYS] + [(name, edges) for name in EDGE_ARRAYS]:
+            setattr(self, "_" + name, view[offset:offset + 4 * count].cast("I"))
+            offset += 4 * count
+
+    def __reduce__(self):
+        # Worker processes reopen the file instead of receiving a copy of it
+        return Gazetteer, (self.path,)
+
+    def __len__(self):
+        return self._names
+
+    def __contains__(self, name):
+        state = 0
+        for char in normalize_name(name):
+            state = self._goto(state, ord(char))
+            if state is None:
+                return False
+        return state != 0 and self._out[state] == state
+
+    def _goto(self, state, label):
+        labels = self._labels
+        start = self._edge_start[state]
+        end = start + self._edge_count[state]
+        i = bisect_left(labels, label, start, end)
+        return self._targets[i] if i < end and labels[i] == label else None
+
+    def find_all(self, text):
+        """Return the (start, end) spans of known names in text, leftmost-longest, non-overlapping.
+
+        Matching ignores case, treats any run of whitespace as one space and
+        only accepts names that start and end on word boundaries.
+        """
+        normalized = _normalize_text(text)
+        fail, out, depth = self._fail, self._out, self._depth
+        edge_start, edge_count, labels, targets = self._edge_start, self._edge_count, self._labels, self._targets
+        positions = deque(maxlen=self.longest)   # Offsets of the chars consumed by the automaton
+        matches = []
+        state = 0
+        previous = ""
+        for i, char in enumerate(normalized):
+            if char == " " and previous == " ":
+                continue
+            previous = char
+            label = ord(char)
+            while True:
+                start = edge_start[state]
+                end = start + edge_count[state]
+                j = bisect_left(labels, label, start, end)
+                if j < end and labels[j] == label:
+                    state = targets[j]
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            positions.append(i)
+            if i + 1 < len(text) and text[i + 1].isalnum():
+                continue
+            # Every name ending here that also starts on a word boundary
+            match = out[state]
+            while match:
+                start = positions[-depth[match]]
+                if start == 0 or not text[start - 1].isalnum():
+                    matches.append((start, i + 1))
+                match = out[fail[match]]
+
+        # Matches end in increasing order; keep the leftmost-longest ones that do not overlap
+        matches.sort(key=lambda span: (span[0], -span[1]))
+        spans = []
+        for start, end in matches:
+            if not spans or start >= spans[-1][1]:
+                spans.append((start, end))
+        return spans
+
+    def close(self):
+        for name in NODE_ARRAYS + EDGE_ARRAYS:
+            getattr(self, "_" + name).release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_names(path, geonames=False, alternate_names=False):
+    """Yield the names in a file: one per line, or the name columns of a GeoNames dump"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not geonames:
+                yield line.rstrip("\n")
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 4:
+                continue
+            yield fields[1]
+            yield fields[2]
+            if alternate_names and fields[3]:
+                yield from fields[3].split(",")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a gazetteer file for PlaceFinder")
+    parser.add_argument("names", help="Text file with one place name per line, or a GeoNames dump")
+    parser.add_argument("output", help="Gazetteer file to write")
+    parser.add_argument("--geonames", action="store_true", help="Read the name and asciiname columns of a GeoNames dump")
+    parser.add_argument("--alternate-names", action="store_true", help="With --geonames, also read alternatenames")
+    args = parser.parse_args(argv)
+
+    with build(iter_names(args.names, args.geonames, args.alternate_names), args.output) as gazetteer:
+        print(f"{len(gazetteer)} names written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
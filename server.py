@@ -0,0 +1,311 @@
+"""HTTP extraction service for PlaceFinder, using only the standard library.
+
+    python server.py --port 8080 --workers 4
+
+Endpoints:
+    POST /extract         {"text": "..."}
+                          -> {"places": {name: count}, "spans": [[start, end, name], ...]}
+    POST /extract/batch   {"documents": ["...", {"id": ..., "text": "..."}, ...]}
+                          -> {"results": [{"id": ..., "places": ..., "spans": ...}, ...]}
+    GET  /health
+    GET  /metrics         Stage timings and counters in Prometheus text format
+
+Texts from concurrent requests are queued and collected into micro-batches.
+Each batch is tagged with one tagger call in a worker process, so the event
+loop only parses and answers requests. When the queue is full new requests
+get 503 with Retry-After, and requests not answered within the timeout get
+504.
+"""
+import argparse
+import asyncio
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import CACHE_MAX_BYTES, ResultCache
+from PlaceFinder import (CORPUS_BATCH_SIZE, ENGINE_COMPILED, ENGINES, PrometheusExporter,
+                         _find_place_spans_batch, _init_worker, ensure_nltk_resources, load_filters)
+from gazetteer import Gazetteer
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+# Seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 30
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class ExtractionService:
+    """Micro-batching front end to a pool of worker processes, each with its own finder.
+
+    Every worker process has one batcher task feeding it: a batcher takes
+    the first queued text, waits batch_wait seconds if fewer than batch_size
+    are queued, then sends everything queued (up to batch_size) to its
+    worker as one batch.
+    """
+    def __init__(self, workers=None, engine=ENGINE_COMPILED, gazetteer=None, batch_size=CORPUS_BATCH_SIZE,
+                 batch_wait=0.005, queue_size=1024, timeout=10.0, max_body=1 << 20, cache=None, filters=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.gazetteer = gazetteer
+        self.cache = cache
+        self.filters = filters
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_body = max_body
+        self.exporter = PrometheusExporter()
+        self.responses = Counter()   # Status code -> responses sent
+        self._executor = None
+        self._queue = None
+        self._batchers = []
+
+    async def start(self):
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                             initargs=(self.engine, self.gazetteer, self.cache, self.filters))
+        self._queue = asyncio.Queue(self.queue_size)
+        self._batchers = [asyncio.create_task(self._batcher()) for _ in range(self.workers)]
+
+    async def close(self):
+        for batcher in self._batchers:
+            batcher.cancel()
+        await asyncio.gather(*self._batchers, return_exceptions=True)
+        self._executor.shutdown(cancel_futures=True)
+
+    async def extract(self, texts):
+        """Queue texts for extraction and return their (start, end, name) spans"""
+        if len(texts) > self.queue_size:
+            raise HTTPError(413, f"At most {self.queue_size} documents per request")
+        if self._queue.qsize() + len(texts) > self.queue_size:
+            raise HTTPError(503, "Too many queued documents", {"Retry-After": "1"})
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in texts]
+        for text, future in zip(texts, futures):
+            self._queue.put_nowait((text, future))
+        try:
+            return await asyncio.wait_for(asyncio.gather(*futures), self.timeout)
+        except asyncio.TimeoutError:
+            # The futures are cancelled, so batchers skip the texts still queued
+            raise HTTPError(504, f"No result within {self.timeout} seconds") from None
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            if self.batch_wait and self._queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.batch_wait)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                results, stats = await loop.run_in_executor(self._executor, _find_place_spans_batch,
+                                                            [text for text, _ in batch])
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.exporter(stats)
+            for (_, future), spans in zip(batch, results):
+                if not future.done():
+                    future.set_result(spans)
+
+    async def handle(self, reader, writer):
+        """Serve the HTTP/1.1 requests of one connection"""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                keep_alive = await self._handle_request(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request_line, reader, writer):
+        """Read one request, write its response and return whether to keep the connection open"""
+        try:
+            method, path, version = request_line.decode("latin-1").split()
+        except ValueError:
+            self._respond(writer, 400, {"error": "Malformed request line"}, False)
+            return False
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            self._respond(writer, 400, {"error": "Invalid Content-Length"}, False)
+            return False
+        if length > self.max_body:
+            # The body is not read, so the connection cannot be reused
+            self._respond(writer, 413, {"error": f"Body larger than {self.max_body} bytes"}, False)
+            return False
+        body = await reader.readexactly(length) if length else b""
+
+        extra_headers = {}
+        try:
+            status, payload = 200, await self._dispatch(method, path.split("?", 1)[0], body)
+        except HTTPError as error:
+            status, payload, extra_headers = error.status, {"error": str(error)}, error.headers
+        except Exception as error:
+            status, payload = 500, {"error": f"{type(error).__name__}: {error}"}
+        self._respond(writer, status, payload, keep_alive, extra_headers)
+        return keep_alive
+
+    async def _dispatch(self, method, path, body):
+        routes = {
+            "/extract": ("POST", self._extract_one),
+            "/extract/batch": ("POST", self._extract_batch),
+            "/health": ("GET", self._health),
+            "/metrics": ("GET", self._metrics),
+        }
+        if path not in routes:
+            raise HTTPError(404, f"No endpoint {path}")
+        route_method, handler = routes[path]
+        if method != route_method:
+            raise HTTPError(405, f"{path} only accepts {route_method}", {"Allow": route_method})
+        return await handler(body)
+
+    async def _extract_one(self, body):
+        request = _parse_json(body)
+        if not isinstance(request.get("text"), str):
+            raise HTTPError(400, 'Expected {"text": "..."}')
+        spans, = await self.extract([request["text"]])
+        return _result(spans)
+
+    async def _extract_batch(self, body):
+        documents = _parse_json(body).get("documents")
+        if not isinstance(documents, list):
+            raise HTTPError(400, 'Expected {"documents": [...]}')
+        ids, texts = [], []
+        for i, document in enumerate(documents):
+            if isinstance(document, dict):
+                ids.append(document.get("id", i))
+                document = document.get("text")
+            else:
+                ids.append(i)
+            if not isinstance(document, str):
+                raise HTTPError(400, f"Document {i} has no text")
+            texts.append(document)
+        results = await self.extract(texts)
+        return {"results": [{"id": doc_id, **_result(spans)} for doc_id, spans in zip(ids, results)]}
+
+    async def _health(self, body):
+        return {"status": "ok", "workers": self.workers, "queued": self._queue.qsize()}
+
+    async def _metrics(self, body):
+        lines = [self.exporter.render().rstrip("\n"),
+                 f"# HELP {self.exporter.prefix}_http_responses_total HTTP responses sent, by status",
+                 f"# TYPE {self.exporter.prefix}_http_responses_total counter"]
+        lines.extend(f'{self.exporter.prefix}_http_responses_total{{status="{status}"}} {count}'
+                     for status, count in sorted(self.responses.items()))
+        lines.append(f"# HELP {self.exporter.prefix}_queued_documents Documents waiting for a worker")
+        lines.append(f"# TYPE {self.exporter.prefix}_queued_documents gauge")
+        lines.append(f"{self.exporter.prefix}_queued_documents {self._queue.qsize()}")
+        return "\n".join(lines) + "\n"
+
+    def _respond(self, writer, status, payload, keep_alive, extra_headers=None):
+        self.responses[status] += 1
+        if isinstance(payload, str):
+            content_type, body = "text/plain; version=0.0.4", payload.encode()
+        else:
+            content_type, body = "application/json", json.dumps(payload, ensure_ascii=False).encode()
+        headers = {"Content-Type": content_type, "Content-Length": str(len(body)),
+                   "Connection": "keep-alive" if keep_alive else "close", **(extra_headers or {})}
+        head = f"HTTP/1.1 {status} {REASONS[status]}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+
+
+def _parse_json(body):
+    try:
+        request = json.loads(body)
+    except ValueError as error:
+        raise HTTPError(400, f"Invalid JSON: {error}") from None
+    if not isinstance(request, dict):
+        raise HTTPError(400, "Expected a JSON object")
+    return request
+
+
+def _result(spans):
+    return {"places": dict(Counter(name for _, _, name in spans)),
+            "spans": [[start, end, name] for start, end, name in spans]}
+
+
+async def serve(service, host, port):
+    await service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving on http://{host}:{port} with {service.workers} workers", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve PlaceFinder over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINE_COMPILED)
+    parser.add_argument("--gazetteer", default=None,
+                        help="Gazetteer file of known place names, built with gazetteer.py")
+    parser.add_argument("--cache", default=None,
+                        help="SQLite file of results shared by the workers; repeated texts are not processed again")
+    parser.add_argument("--cache-size", type=float, default=CACHE_MAX_BYTES / 2**20,
+                        help="Megabytes of results kept in the cache")
+    parser.add_argument("--filters", default=None,
+                        help="Extra post-processing filters as module:attribute, a list of "
+                             "(filter_type, check, version) tuples")
+    parser.add_argument("--batch-size", type=int, default=CORPUS_BATCH_SIZE,
+                        help="Most documents tagged together in one batch")
+    parser.add_argument("--batch-wait", type=float, default=5.0,
+                        help="Milliseconds to wait for more documents before tagging a partial batch")
+    parser.add_argument("--queue-size", type=int, default=1024,
+                        help="Queued documents before new requests get 503")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds before a request gets 504")
+    parser.add_argument("--max-body", type=int, default=1 << 20, help="Largest request body in bytes")
+    args = parser.parse_args(argv)
+
+    # Download missing data once here rather than in every worker
+    ensure_nltk_resources()
+    gazetteer = Gazetteer(args.gazetteer) if args.gazetteer else None
+    cache = ResultCache(args.cache, int(args.cache_size * 2**20)) if args.cache else None
+    filters = load_filters(args.filters) if args.filters else None
+    service = ExtractionService(args.workers, args.engine, gazetteer, args.batch_size, args.batch_wait / 1000,
+                                args.queue_size, args.timeout, args.max_body, cache, filters)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Offline stand-ins for the NLTK sentence tokenizer and tagger.
+
+Sentences end at . ! or ? followed by whitespace, and a token's tag only
+depends on the token, so results do not depend on which sentences a
+finder chose to tag, only on whether the tags it looks up were there.
+With context set, the tag of a capitalized token depends on the token
+before it too, so the same word gets different tags in different
+sentences, as with the real tagger.
+"""
+import os
+import re
+import sys
+import zlib
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import PlaceFinder as P  # noqa: E402
+
+SENTENCE_BREAK = re.compile(r"[.!?]\s+")
+TOKEN = re.compile(r"\w+|[^\w\s]")
+# Tags of capitalized tokens, picked by a hash of the token (and the one before, with context)
+CAPITALIZED_TAGS = ("NNP", "NNP", "NNPS", "NN", "VB", "JJ")
+
+
+def tag(token, proper_nouns=(), previous=""):
+    if token in proper_nouns:
+        return "NNP"
+    if token[:1].isupper():
+        key = f"{previous} {token}".encode("utf-8", "surrogatepass")
+        return CAPITALIZED_TAGS[zlib.crc32(key) % len(CAPITALIZED_TAGS)]
+    return "NN" if token.isalpha() else "SYM"
+
+
+class StubNLTK:
+    """Records what the finder asked the tokenizer and tagger for"""
+    def __init__(self):
+        self.split_lengths = []      # Length of every text split into sentences
+        self.tagged = []             # Every sentence tagged
+        self.proper_nouns = set()    # Tokens always tagged NNP
+        self.context = False         # Whether tags depend on the previous token
+
+    def span_tokenize(self, text):
+        self.split_lengths.append(len(text))
+        start = 0
+        for match in SENTENCE_BREAK.finditer(text):
+            yield start, match.start() + 1
+            start = match.end()
+        if text[start:].strip():
+            yield start, len(text.rstrip())
+
+    def tag_sentences(self, sentences):
+        self.tagged.extend(sentences)
+        tagged = []
+        for sentence in sentences:
+            tokens = TOKEN.findall(sentence)
+            previous = [""] + tokens[:-1] if self.context else [""] * len(tokens)
+            tagged.append([(token, tag(token, self.proper_nouns, before)) for token, before in zip(tokens, previous)])
+        return tagged
+
+
+@pytest.fixture
+def nltk_stub(monkeypatch):
+    stub = StubNLTK()
+    monkeypatch.setattr(P, "_sentence_tokenizer", lambda: stub)
+    monkeypatch.setattr(P, "_tag_sentences", stub.tag_sentences)
+    return stub
@@ -0,0 +1,182 @@
+"""Randomized checks that the automaton engines and the filter pipeline agree.
+
+The reference automaton is the specification: the compiled and prescan
+engines, fed a text whole or in random chunks, must find the same raw
+candidates at the same offsets and log the same events. Post-processing
+is checked against a plain sequential version of the filters. Nothing
+here needs the NLTK data: tags are assigned at random.
+
+    python -m pytest -q tests
+"""
+import importlib.util
+import os
+import random
+import sys
+from collections import Counter
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import PlaceFinder as P  # noqa: E402
+
+HAVE_NUMPY = importlib.util.find_spec("numpy") is not None
+
+COMPILED_ENGINES = [
+    P.ENGINE_COMPILED,
+    pytest.param(P.ENGINE_PRESCAN, marks=pytest.mark.skipif(not HAVE_NUMPY, reason="prescan needs NumPy")),
+]
+
+# Texts per test; every seed covers different random texts
+TEXTS = 300
+SEEDS = range(4)
+
+WORDS = ["the", "of", "and", "for", "The", "Of", "And", "For", "New", "York", "City", "Bay", "San", "Jose",
+         "Singapore", "May", "Mr", "Dr", "He", "It", "x", "A", "a", "an", "Ⅷ", "ǅungla", "Éire", "中国"]
+CHARS = list("aAbBTOFxyz.,-1'") + ["Ⅷ", "ⓐ", "ⓑ", "中", "É", "é", "ǅ", "ª", " "]
+SEPARATORS = [" ", " ", " ", "  ", "\n", "\t", ". ", ", ", "! ", "\n\n", ""]
+TAGS = ["NNP", "NNPS", "NN", "NNS", "VB", "JJ", "DT", None]
+
+
+def random_text(rng):
+    """Words that make and break place names, odd character classes and whitespace of every kind"""
+    parts = []
+    for _ in range(rng.randint(0, 60)):
+        if rng.random() < 0.6:
+            parts.append(rng.choice(WORDS))
+        else:
+            parts.append("".join(rng.choice(CHARS) for _ in range(rng.randint(1, 5))))
+        parts.append(rng.choice(SEPARATORS))
+    return "".join(parts)
+
+
+def random_chunks(rng, text):
+    chunks = []
+    i = 0
+    while i < len(text):
+        size = rng.choice([1, 1, 2, 3, rng.randint(1, 40)])
+        chunks.append(text[i:i + size])
+        i += size
+    return chunks
+
+
+def random_tags(rng, candidates):
+    """A token_tag_map for the words of the candidates; words mapped to None are left untagged"""
+    tags = {}
+    for candidate in candidates:
+        for word in candidate.split(" "):
+            tag = rng.choice(TAGS)
+            if tag is not None:
+                tags.setdefault(word, tag)
+    return tags
+
+
+def run_engine(engine, text, trace_level=P.TRACE_OFF):
+    finder = P.PlaceFinder(engine=engine, trace_level=trace_level)
+    finder._run_automaton(text, engine)
+    return finder
+
+
+def feed_in_chunks(engine, chunks):
+    automaton = P.CompiledAutomaton(prescan=engine == P.ENGINE_PRESCAN)
+    candidates, spans = [], []
+    for chunk in chunks:
+        automaton.feed(chunk, candidates, spans)
+    automaton.finish(candidates, spans)
+    return candidates, spans
+
+
+def without_engine_detail(logs):
+    """Event logs with the ProcessStart detail, which names the engine, left out"""
+    return [{key: value for key, value in entry.items() if key != "detail"} if entry["event"] == "ProcessStart"
+            else entry for entry in logs]
+
+
+def sequential_check(finder, candidate):
+    """The filters one after the other, as post-processing ran them before the pipeline"""
+    words = candidate.split(" ")
+    if len(words) > 1 and len(set(words)) < len(words):
+        return "DuplicateWords"
+    if len(candidate) < 2:
+        return "Length"
+    if len(words) == 1 and candidate in P.COMMON_WORDS_EXCLUSION_SET:
+        return "CommonWord"
+    if len(words) > 1 and words[0] in P.COMMON_WORDS_EXCLUSION_SET and words[0].lower() != "the":
+        return "FirstWordCommon"
+    if len(words) > 1 and words[-1].lower() in P.CONNECTING_WORDS:
+        return "LastWordConnector"
+    for word in words:
+        if word.lower() not in P.CONNECTING_WORDS and finder._is_potential_place_token(word):
+            return None
+    return "POSTaggingCheck"
+
+
+@pytest.mark.parametrize("engine", COMPILED_ENGINES)
+@pytest.mark.parametrize("seed", SEEDS)
+def test_engines_find_reference_candidates(engine, seed):
+    rng = random.Random(seed)
+    for _ in range(TEXTS):
+        text = random_text(rng)
+        reference = run_engine(P.ENGINE_REFERENCE, text)
+        compiled = run_engine(engine, text)
+        assert compiled.raw_candidates == reference.raw_candidates, text
+        assert compiled.raw_spans == reference.raw_spans, text
+
+        candidates, spans = feed_in_chunks(engine, random_chunks(rng, text))
+        assert candidates == reference.raw_candidates, text
+        assert spans == reference.raw_spans, text
+
+
+@pytest.mark.parametrize("engine", COMPILED_ENGINES)
+@pytest.mark.parametrize("seed", SEEDS)
+def test_engines_log_the_same_events(engine, seed):
+    rng = random.Random(seed)
+    for _ in range(TEXTS):
+        text = random_text(rng)
+        reference = run_engine(P.ENGINE_REFERENCE, text, P.TRACE_EVENTS)
+        compiled = run_engine(engine, text, P.TRACE_EVENTS)
+        tags = random_tags(rng, reference.raw_candidates)
+        for finder in (reference, compiled):
+            finder.token_tag_map = dict(tags)
+        assert reference.post_process_candidates() == compiled.post_process_candidates(), text
+        assert without_engine_detail(compiled.get_logs()) == without_engine_detail(reference.get_logs()), text
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_full_trace_renders_every_character(seed):
+    rng = random.Random(seed)
+    for _ in range(TEXTS // 3):
+        text = random_text(rng)
+        finder = run_engine(P.ENGINE_REFERENCE, text, P.TRACE_FULL)
+        events = run_engine(P.ENGINE_REFERENCE, text, P.TRACE_EVENTS).get_logs()
+        logs = finder.get_logs()
+        transitions = [entry for entry in logs if "event" not in entry]
+        assert [entry for entry in logs if "event" in entry] == events
+        # One transition per character, then one for the end of the text if a candidate was still open
+        chars = [entry["char"] for entry in transitions]
+        assert chars[:len(text)] == list(text)
+        assert chars[len(text):] in ([], [P.EOF_CHAR])
+        for previous, entry in zip(transitions, transitions[1:]):
+            assert entry["prev_state"] == previous["new_state"]
+        finalized = [entry["action"].split("Finalized candidate: '", 1)[1][:-1]
+                     for entry in transitions if "Finalized candidate: '" in entry["action"]]
+        assert finalized == finder.raw_candidates, text
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_post_processing_matches_sequential_filters(seed):
+    rng = random.Random(seed)
+    for _ in range(TEXTS):
+        text = random_text(rng)
+        finder = run_engine(P.ENGINE_COMPILED, text, P.TRACE_EVENTS)
+        finder.token_tag_map = random_tags(rng, finder.raw_candidates)
+        decisions = [(candidate, sequential_check(finder, candidate)) for candidate in finder.raw_candidates]
+
+        counts = finder.post_process_candidates()
+        assert counts == dict(Counter(candidate for candidate, filter_type in decisions if filter_type is None))
+        assert finder.get_stats()["rejections"] == dict(Counter(filter_type for _, filter_type in decisions
+                                                                if filter_type is not None))
+        logged = [(entry["candidate"], entry["filter_type"])
+                  for entry in finder.get_logs() if entry["event"] == "PostProcessFilter"]
+        assert logged == [(candidate, filter_type) for candidate, filter_type in decisions if filter_type is not None]
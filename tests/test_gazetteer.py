@@ -0,0 +1,24 @@
+"""Known place names from a gazetteer, with the offline NLTK stubs of conftest.py"""
+import PlaceFinder as P
+from gazetteer import build
+
+
+def finder_with(tmp_path, names):
+    return P.PlaceFinder(engine=P.ENGINE_COMPILED, trace_level=P.TRACE_OFF,
+                         gazetteer=build(names, str(tmp_path / "places.gaz")))
+
+
+def test_lowercase_name_is_tagged_without_any_capital(tmp_path, nltk_stub):
+    # No raw candidate overlaps the sentence, so only the match can get it tagged
+    nltk_stub.proper_nouns.add("paris")
+    finder = finder_with(tmp_path, ["Paris"])
+    assert finder.find_places("we flew to paris.") == {"paris": 1}
+    assert finder.get_stats()["sentences_tagged"] == 1
+    assert finder.find_places("We flew to paris.") == {"paris": 1}
+    assert finder.find_places_batch(["we flew to paris.", "we flew home."]) == [{"paris": 1}, {}]
+
+
+def test_lowercase_name_needs_a_proper_noun_tag(tmp_path, nltk_stub):
+    finder = finder_with(tmp_path, ["Bath", "Reading", "Nice", "Of", "The", "Walla Walla"])
+    assert finder.find_places("we took a bath and the reading was nice. of the walla walla trip.") == \
+        {"walla walla": 1}
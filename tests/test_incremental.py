@@ -0,0 +1,75 @@
+"""Incremental analysis must give what a fresh finder gives on the edited text"""
+import random
+
+import pytest
+
+import PlaceFinder as P
+from test_engines import SEEDS, WORDS
+
+EDITS = 60
+ENDINGS = [". ", ". ", "! ", "? ", ".\n", ".\n\n", " ", ", "]
+
+
+def random_document(rng, sentences):
+    parts = []
+    for _ in range(sentences):
+        parts.extend(rng.choice(WORDS) + " " for _ in range(rng.randint(0, 8)))
+        parts.append(rng.choice(WORDS) + rng.choice(ENDINGS))
+    return "".join(parts)
+
+
+def random_edit(rng, text):
+    """Insert, delete, replace, repeat or move a piece of text, across sentence breaks or not"""
+    start = rng.randint(0, len(text))
+    end = min(len(text), start + rng.choice([0, 1, 2, 5, 20, 80]))
+    kind = rng.choice(["insert", "delete", "replace", "replace", "repeat", "move"])
+    if kind == "insert":
+        return text[:start] + random_document(rng, rng.randint(0, 2)) + text[start:]
+    if kind == "delete":
+        return text[:start] + text[end:]
+    if kind == "replace":
+        return text[:start] + rng.choice([rng.choice(WORDS), ".", ". ", " ", "\n", "Of the "]) + text[end:]
+    if kind == "repeat":
+        return text[:end] + text[start:end] + text[end:]
+    rest = text[:start] + text[end:]
+    position = rng.randint(0, len(rest))
+    return rest[:position] + text[start:end] + rest[position:]
+
+
+def full_run(text):
+    finder = P.PlaceFinder(engine=P.ENGINE_COMPILED, trace_level=P.TRACE_OFF)
+    counts = finder.find_places(text)
+    return finder, counts
+
+
+@pytest.mark.parametrize("cache_size", [1, 3, P.INCREMENTAL_CACHE_SIZE])
+@pytest.mark.parametrize("seed", SEEDS)
+def test_incremental_runs_match_full_runs(nltk_stub, seed, cache_size):
+    # Tags that depend on context make filter decisions depend on other sentences
+    nltk_stub.context = True
+    rng = random.Random(seed)
+    finder = P.PlaceFinder(engine=P.ENGINE_COMPILED, trace_level=P.TRACE_OFF, incremental=True,
+                           cache_size=cache_size)
+    text = random_document(rng, rng.randint(0, 12))
+    for _ in range(EDITS):
+        counts = finder.find_places(text)
+        expected, expected_counts = full_run(text)
+        assert counts == expected_counts, text
+        assert finder.raw_candidates == expected.raw_candidates, text
+        assert finder.raw_spans == expected.raw_spans, text
+        assert finder.get_pos_tags_lines() == expected.get_pos_tags_lines(), text
+        assert len(finder._units) <= cache_size
+        text = random_edit(rng, text)
+
+
+def test_unchanged_sentences_are_not_tagged_again(nltk_stub):
+    finder = P.PlaceFinder(engine=P.ENGINE_COMPILED, trace_level=P.TRACE_OFF, incremental=True)
+    text = "We met in Paris. Then we left for Rome. He stayed in Berlin. "
+    finder.find_places(text)
+    assert finder.get_stats()["sentences_tagged"] == 3
+    edited = text.replace("Rome", "Madrid")
+    _, expected_counts = full_run(edited)
+    tagged = len(nltk_stub.tagged)
+    assert finder.find_places(edited) == expected_counts
+    assert finder.get_stats()["sentences_tagged"] == 1
+    assert nltk_stub.tagged[tagged:] == ["Then we left for Madrid."]
@@ -0,0 +1,72 @@
+"""iter_places must find what find_place_spans finds on the whole text, holding a bounded buffer"""
+import io
+import random
+
+import pytest
+
+import PlaceFinder as P
+from test_engines import SEEDS, TEXTS, random_chunks
+from test_incremental import random_document
+
+LOG_LINE = "2024-05-01 12:00:{:02d} INFO request from Paris host handled, user New York City and the Bay\n"
+
+
+def finder():
+    return P.PlaceFinder(engine=P.ENGINE_COMPILED, trace_level=P.TRACE_OFF)
+
+
+@pytest.mark.parametrize("sentence_context", [P.SENTENCE_CONTEXT, 4])
+@pytest.mark.parametrize("seed", SEEDS)
+def test_stream_matches_whole_text(nltk_stub, monkeypatch, seed, sentence_context):
+    # A small context makes short texts split again from the middle of the buffer
+    monkeypatch.setattr(P, "SENTENCE_CONTEXT", sentence_context)
+    # iter_places looks up tags in the sentences around a candidate rather than in the whole
+    # text, which gives the same results as long as the candidate's words are tokens of its
+    # own sentence: texts are made of whole words for that (test_engines covers odd ones)
+    rng = random.Random(seed)
+    for _ in range(TEXTS // 3):
+        text = random_document(rng, rng.randint(0, 10))
+        expected = finder().find_place_spans(text)
+        assert list(finder().iter_places(text, chunk_size=1)) == expected, text
+        assert list(finder().iter_places(random_chunks(rng, text))) == expected, text
+        assert list(finder().iter_places(io.StringIO(text), chunk_size=rng.randint(2, 12))) == expected, text
+        assert list(finder().iter_places([text])) == expected, text
+
+
+@pytest.mark.parametrize("separator", ["\n", " "])
+def test_text_without_sentence_breaks_is_cut(nltk_stub, separator):
+    text = "".join(LOG_LINE.format(i % 60).replace("\n", separator) for i in range(3 * P.MAX_SENTENCE_LENGTH // 80))
+    assert len(text) > 2 * P.MAX_SENTENCE_LENGTH
+    expected = finder().find_place_spans(text)
+    nltk_stub.split_lengths.clear()
+    nltk_stub.tagged.clear()
+
+    chunk_size = 4096
+    stream = finder()
+    assert list(stream.iter_places(io.StringIO(text), chunk_size=chunk_size)) == expected
+    assert stream.get_stats()["sentences"] > 2
+    # The buffer never held much more than MAX_SENTENCE_LENGTH characters, and text already
+    # split was not split again beyond SENTENCE_CONTEXT characters per chunk
+    assert max(nltk_stub.split_lengths) <= P.MAX_SENTENCE_LENGTH + chunk_size
+    assert sum(nltk_stub.split_lengths) <= 2 * len(text)
+    assert max(map(len, nltk_stub.tagged)) <= P.MAX_SENTENCE_LENGTH + chunk_size
+    # and was cut at line breaks where there were any
+    if separator == "\n":
+        assert all(sentence.endswith("\n") for sentence in nltk_stub.tagged[:-1])
+
+
+def test_places_are_yielded_before_the_stream_ends(nltk_stub):
+    nltk_stub.proper_nouns.add("Paris")
+    lines = [f"We reached Paris on day {i}. It rained.\n" for i in range(100)]
+    read = 0
+
+    def source():
+        nonlocal read
+        for line in lines:
+            read += 1
+            yield line
+
+    places = finder().iter_places(source())
+    assert next(places)[2] == "Paris"
+    assert read < 5
+    assert len(list(places)) == 99
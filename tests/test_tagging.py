@@ -0,0 +1,35 @@
+"""Lazy tagging: only sentences whose candidates reach a tag lookup are tagged"""
+import random
+
+import PlaceFinder as P
+from gazetteer import build
+from test_engines import SEEDS, TEXTS, random_tags, random_text, run_engine
+
+
+def test_candidates_rejected_before_the_pos_check_are_not_tagged(nltk_stub):
+    finder = P.PlaceFinder(engine=P.ENGINE_COMPILED, trace_level=P.TRACE_OFF)
+    text = "The weather was fine. It rained later. We stayed home. He said nothing. " * 50
+    assert finder.find_places(text) == {}
+    assert finder.get_stats()["sentences"] == 200
+    assert finder.get_stats()["sentences_tagged"] == 0
+    assert nltk_stub.tagged == []
+
+    finder.find_places("The weather was fine. We met in Paris. He said nothing.")
+    assert nltk_stub.tagged == ["We met in Paris."]
+
+
+def test_decisions_without_tags_do_not_depend_on_them(tmp_path):
+    gazetteer = build(["New York", "Bay", "san jose", "the", "x"], str(tmp_path / "places.gaz"))
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        for _ in range(TEXTS):
+            finder = run_engine(P.ENGINE_COMPILED, random_text(rng))
+            finder.gazetteer = gazetteer if rng.random() < 0.5 else None
+            for candidate in dict.fromkeys(finder.raw_candidates):
+                if finder._needs_tags(candidate):
+                    continue
+                decisions = set()
+                for _ in range(4):
+                    finder.token_tag_map = random_tags(rng, [candidate])
+                    decisions.add(finder._check_candidate(candidate))
+                assert len(decisions) == 1, candidate